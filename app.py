@@ -4,27 +4,47 @@
 
 import streamlit as st
 import pandas as pd
-import os, io, zipfile, hashlib
+import os, io, zipfile, hashlib, threading, shutil
+from collections import OrderedDict
 from datetime import datetime
 
+try:
+    import pyarrow  # noqa: F401 (opcional: segmentos parquet do histórico)
+    TEM_PYARROW = True
+except ImportError:
+    TEM_PYARROW = False
+
 st.set_page_config(page_title="Painel - Etapa 3 (Gestão)", layout="wide")
 
 # ---------------- Config ----------------
 DATA_DIR = "data"
-USERS_CSV = os.path.join(DATA_DIR, "users.csv")
-PROJ_CSV = os.path.join(DATA_DIR, "projetistas.csv")
-HIST_CSV = os.path.join(DATA_DIR, "historico_demandas.csv")
-ROOMS_CSV = os.path.join(DATA_DIR, "salas.csv")
-LOG_CSV = os.path.join(DATA_DIR, "log_gestao.csv")
-INATIVOS_CSV = os.path.join(DATA_DIR, "inativos.csv")
+# Empresas (multi-tenant): a empresa padrão usa DATA_DIR; as demais usam DATA_DIR/empresas/<id>
+EMPRESAS_CSV = os.path.join(DATA_DIR, "empresas.csv")
+EMPRESAS_SUBDIR = "empresas"
+EMPRESA_PADRAO = "padrao"
+MAX_EMPRESAS_EM_CACHE = 8  # empresas com tabelas mantidas em memória (LRU)
+# arquivos por empresa (relativos ao diretório da empresa, ver caminho())
+USERS_CSV = "users.csv"
+PROJ_CSV = "projetistas.csv"
+HIST_CSV = "historico_demandas.csv"
+ROOMS_CSV = "salas.csv"
+LOG_CSV = "log_gestao.csv"
+INATIVOS_CSV = "inativos.csv"
+# histórico: historico_demandas.csv guarda só a janela recente; meses anteriores viram segmentos imutáveis
+HIST_ARQUIVO_DIR = "historico_arquivo"
+JANELA_HISTORICO_MESES = 6
+SEGMENTO_EXT = ".parquet" if TEM_PYARROW else ".csv.gz"  # parquet (zstd) requer pyarrow
+SUFIXO_INATIVO = " (Inativo)"
 BACKUP_NAME_PREFIX = "backup_"
 
 SALT = "painel_avaliacao_salt_v1"
 VAGAS_POR_SALA_DEFAULT = 6
 CLASSES = ["S","A","B","C","D"]
-DISCIPLINAS = ["Hidrossanitário","Elétrica"]  # fixed as requested
+DISCIPLINAS = ["Hidrossanitário","Elétrica"]  # padrão; cada empresa pode definir as suas em empresas.csv
+SALAS_POR_DISCIPLINA_DEFAULT = 2
 
-# Predefined users (only created when users.csv missing)
+# Predefined users (only created when users.csv missing). As senhas abaixo valem só para a empresa padrão;
+# as demais empresas usam a senha_inicial definida em empresas.csv
 PREDEFINED_USERS = [
     {"usuario":"diretor1","nome":"Diretor 1","role":"Diretor","plain_pw":"diretor1!"},
     {"usuario":"diretor2","nome":"Diretor 2","role":"Diretor","plain_pw":"diretor2!"},
@@ -90,6 +110,32 @@ CRITERIOS = {
                     (3,"Não usa corretamente, resiste à ferramenta","Resistência total")]
 }
 
+# ---------------- Schemas ----------------
+# coluna -> (dtype, valor padrão ao migrar arquivos antigos / células vazias)
+SCHEMAS = {
+    "users":{"usuario":(str,""),"nome":(str,""),"role":(str,""),"senha_hash":(str,""),"cor_tema":(str,""),
+             "ativo":("boolean",True),"criado_em":(str,""),"ultimo_login":(str,""),"sala_atribuida":("Int64",pd.NA)},
+    "rooms":{"Sala":("int64",0),"Equipe":(str,""),"Vagas":("int64",VAGAS_POR_SALA_DEFAULT)},
+    "projetistas":{"Sala":("int64",0),"Equipe":(str,""),"Classe":(str,"-"),"Projetista":(str,"-"),
+                   "Pontuação":("int64",0),"Status":(str,"Ativo"),"RankingClasse":(str,"-")},
+    "historico":{"Timestamp":("datetime64[ns]",pd.NaT),"Disciplina":(str,""),"Demanda":(str,""),"Projetista":(str,""),
+                 "Parâmetro":(str,""),"Nota":("float64",float("nan")),"Resumo":(str,""),"PontosAtribuídos":("float64",float("nan"))},
+    "log":{"timestamp":(str,""),"usuario":(str,""),"role":(str,""),"acao":(str,""),"detalhes":(str,"")},
+    "inativos":{"Projetista":(str,""),"Pontuacao":("int64",0),"RemovidoEm":(str,"")},
+    # disciplinas separadas por ';'; senha_inicial: senha das contas predefinidas ao criar a empresa
+    "empresas":{"empresa":(str,""),"nome":(str,""),"disciplinas":(str,""),"senha_inicial":(str,"")},
+}
+# colunas sem as quais o arquivo é rejeitado (ex.: backup de outro sistema)
+REQUIRED_COLS = {
+    "users":["usuario","role","senha_hash"],
+    "rooms":["Sala","Equipe"],
+    "projetistas":["Sala","Projetista"],
+    "historico":["Demanda","Projetista"],
+    "log":["acao"],
+    "inativos":["Projetista"],
+    "empresas":["empresa"],
+}
+
 # ---------------- Utilities ----------------
 def rerun_safe():
     try:
@@ -100,91 +146,377 @@ def rerun_safe():
         except Exception:
             pass
 
+# st.fragment (1.37+) / st.experimental_fragment (1.33+): a seção reroda sozinha quando um widget dela muda.
+# Em versões sem suporte a função roda normalmente a cada rerun.
+fragmento = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+def concluir(msg, download=None):
+    # ação que alterou dados dentro de um fragmento: rerun completo para as outras seções
+    # refletirem a mudança; a mensagem (e o download opcional) é exibida no topo
+    st.session_state._flash = {"msg":msg, "download":download}
+    rerun_safe()
+
+def empresa_atual():
+    return st.session_state.get("empresa", EMPRESA_PADRAO)
+
+def diretorio_empresa(empresa):
+    if empresa == EMPRESA_PADRAO:
+        return DATA_DIR
+    return os.path.join(DATA_DIR, EMPRESAS_SUBDIR, empresa)
+
+def caminho(arquivo):
+    return os.path.join(diretorio_empresa(empresa_atual()), arquivo)
+
 def ensure_data_dir():
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
+    os.makedirs(diretorio_empresa(empresa_atual()), exist_ok=True)
 
 def hash_password(pw):
     return hashlib.sha256((SALT + pw).encode("utf-8")).hexdigest()
 
+# ---------------- Persistence: schema-aware CSV ----------------
+def _para_bool(v):
+    if isinstance(v,str):
+        v = v.strip().lower()
+        if v in ("true","1","sim","yes"): return True
+        if v in ("false","0","não","nao","no"): return False
+        return pd.NA
+    if pd.isna(v): return pd.NA
+    return bool(v)
+
+def _coagir(df, tabela):
+    # slow path: converte coluna a coluna (arquivos antigos, tipos mistos, colunas faltando)
+    df = df.copy()
+    for col,(dtype,padrao) in SCHEMAS[tabela].items():
+        if col not in df.columns:
+            df[col] = padrao
+        s = df[col]
+        if dtype=="datetime64[ns]":
+            df[col] = pd.to_datetime(s, errors="coerce", format="ISO8601")
+        elif dtype=="boolean":
+            df[col] = s.map(_para_bool).astype("boolean").fillna(padrao)
+        elif dtype in ("int64","Int64","float64"):
+            num = pd.to_numeric(s, errors="coerce")
+            if dtype=="int64":
+                num = num.fillna(padrao)
+            if dtype!="float64":
+                num = num.round()
+            df[col] = num.astype(dtype)
+        else:
+            df[col] = s.fillna(padrao).astype(str)
+    return df[list(SCHEMAS[tabela])]
+
+def validar_schema(df, tabela):
+    faltando = [c for c in REQUIRED_COLS[tabela] if c not in df.columns]
+    if faltando:
+        raise ValueError(f"{tabela}: colunas obrigatórias ausentes: {', '.join(faltando)}")
+    return _coagir(df, tabela)
+
+def novas_linhas(tabela, rows):
+    # linhas novas já com os dtypes do schema (concat não degrada as colunas para object)
+    return _coagir(pd.DataFrame(rows), tabela)
+
+def _ler_csv(fonte, tabela):
+    schema = SCHEMAS[tabela]
+    datas = [c for c,(d,_) in schema.items() if d=="datetime64[ns]"]
+    dtypes = {c:d for c,(d,_) in schema.items() if c not in datas}
+    # célula vazia só vira NaN/NA nas colunas não-texto; texto mantém "" (e "NA", "null"... literais)
+    vazios = {c:[""] for c,(d,_) in schema.items() if d is not str}
+    try:
+        # fast path: arquivo já no formato atual. Engine C: o engine pyarrow infere os tipos antes de aplicar
+        # dtype (ISO vira timestamp, vazio vira "nan"/"NaT"), o que corrompe as colunas declaradas str
+        df = pd.read_csv(fonte, usecols=list(schema), dtype=dtypes, parse_dates=datas or None, keep_default_na=False, na_values=vazios)
+    except (ValueError, TypeError):
+        if hasattr(fonte,"seek"): fonte.seek(0)
+        texto = {c:str for c,(d,_) in schema.items() if d is str}
+        return validar_schema(pd.read_csv(fonte, dtype=texto, keep_default_na=False, na_values=vazios), tabela), True
+    df = df[list(schema)].fillna({c:p for c,(_,p) in schema.items() if c not in datas and not pd.isna(p)})
+    for c in datas:
+        if not pd.api.types.is_datetime64_any_dtype(df[c]):
+            df[c] = pd.to_datetime(df[c], errors="coerce", format="ISO8601")
+    return df, False
+
+def ler_csv(fonte, tabela):
+    return _ler_csv(fonte, tabela)[0]
+
+# ---------------- Cache de tabelas por empresa (compartilhado entre sessões) ----------------
+@st.cache_resource
+def _cache_empresas():
+    # {diretório da empresa: {path: ((mtime, tamanho), df)}}, da menos para a mais usada
+    return {"lock":threading.Lock(), "dados":OrderedDict(), "arquivo_lock":threading.Lock()}
+
+def _carimbo(path):
+    info = os.stat(path)
+    return (info.st_mtime_ns, info.st_size)
+
+def _cache_get(path):
+    cache = _cache_empresas()
+    chave = os.path.dirname(path)
+    with cache["lock"]:
+        tabelas = cache["dados"].get(chave)
+        if tabelas is None or path not in tabelas:
+            return None
+        cache["dados"].move_to_end(chave)
+        carimbo, df = tabelas[path]
+    # cada sessão edita seu DataFrame in-place: nunca devolver o objeto do cache
+    return df.copy() if carimbo == _carimbo(path) else None
+
+def _cache_put(path, df, carimbo):
+    cache = _cache_empresas()
+    chave = os.path.dirname(path)
+    with cache["lock"]:
+        cache["dados"].setdefault(chave, {})[path] = (carimbo, df.copy())
+        cache["dados"].move_to_end(chave)
+        while len(cache["dados"]) > MAX_EMPRESAS_EM_CACHE:
+            cache["dados"].popitem(last=False)  # empresa ociosa há mais tempo sai da memória
+
+def _cache_invalidar(path):
+    cache = _cache_empresas()
+    with cache["lock"]:
+        cache["dados"].get(os.path.dirname(path), {}).pop(path, None)
+
+def carregar_tabela(path, tabela):
+    df = _cache_get(path)
+    if df is not None:
+        return df
+    carimbo = _carimbo(path)  # antes de ler: se outra sessão gravar durante a leitura, o carimbo não bate
+    df, migrado = _ler_csv(path, tabela)
+    if migrado:
+        _gravar_csv(df, path)  # grava já no formato atual (próxima leitura entra no cache)
+    elif _carimbo(path) == carimbo:
+        _cache_put(path, df, carimbo)
+    return df
+
+def _gravar_csv(df, path):
+    # grava em arquivo temporário e troca atomicamente: outra sessão nunca lê um CSV pela metade
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.to_csv(tmp,index=False)
+    os.replace(tmp, path)
+
+def salvar_tabela(df, path):
+    _gravar_csv(df, path)
+    _cache_invalidar(path)
+
+# ---------------- Empresas ----------------
+def carregar_empresas():
+    padrao = {"empresa":EMPRESA_PADRAO,"nome":"Padrão","disciplinas":";".join(DISCIPLINAS),"senha_inicial":""}
+    if not os.path.exists(EMPRESAS_CSV):
+        return novas_linhas("empresas", [padrao])
+    df = carregar_tabela(EMPRESAS_CSV, "empresas")
+    # o id vira nome de diretório: só aceita ids simples
+    df = df[df["empresa"].str.fullmatch(r"[a-z0-9_-]+")].drop_duplicates("empresa")
+    # empresa nova sem senha_inicial não pode ser criada (as contas teriam as senhas públicas da padrão)
+    existe = df["empresa"].map(lambda e: e==EMPRESA_PADRAO or os.path.exists(os.path.join(diretorio_empresa(e), USERS_CSV)))
+    df = df[existe | (df["senha_inicial"].str.strip()!="")]
+    if EMPRESA_PADRAO not in df["empresa"].values:
+        df = pd.concat([novas_linhas("empresas", [padrao]), df], ignore_index=True)
+    return df.reset_index(drop=True)
+
+def senha_inicial_empresa():
+    row = EMPRESAS[EMPRESAS["empresa"]==empresa_atual()]
+    return row["senha_inicial"].iat[0].strip() if not row.empty else ""
+
+def disciplinas_empresa():
+    row = EMPRESAS[EMPRESAS["empresa"]==empresa_atual()]
+    disc = [d.strip() for d in row["disciplinas"].iat[0].split(";") if d.strip()] if not row.empty else []
+    return disc or DISCIPLINAS
+
+# ---------------- Versão dos dados (memoização de tabelas derivadas) ----------------
+def marcar_alterado(*tabelas):
+    versoes = st.session_state.setdefault("_versoes", {})
+    for t in tabelas:
+        versoes[t] = versoes.get(t,0) + 1
+
+def versao_dados(*tabelas):
+    versoes = st.session_state.get("_versoes", {})
+    return tuple(versoes.get(t,0) for t in tabelas)
+
+def memo(nome, tabelas, calcular):
+    # recalcula só quando alguma tabela de origem foi salva desde o último cálculo (não alterar o retorno)
+    chave = versao_dados(*tabelas)
+    cache = st.session_state.setdefault("_memo", {})
+    if nome not in cache or cache[nome][0] != chave:
+        cache[nome] = (chave, calcular())
+    return cache[nome][1]
+
 # ---------------- Persistence: ensure & load ----------------
 def ensure_users():
     ensure_data_dir()
-    if not os.path.exists(USERS_CSV):
+    if not os.path.exists(caminho(USERS_CSV)):
+        senha_empresa = None if empresa_atual()==EMPRESA_PADRAO else senha_inicial_empresa()
+        if senha_empresa == "":
+            raise ValueError(f"Empresa '{empresa_atual()}' sem senha_inicial em empresas.csv")
         rows = []
         for u in PREDEFINED_USERS:
             rows.append({
                 "usuario":u["usuario"],
                 "nome":u["nome"],
                 "role":u["role"],
-                "senha_hash":hash_password(u["plain_pw"]),
+                "senha_hash":hash_password(senha_empresa or u["plain_pw"]),
                 "cor_tema":"",
                 "ativo":True,
                 "criado_em":datetime.now().isoformat(),
                 "ultimo_login":"",
-                "sala_atribuida":""  # only for coordenadores
+                "sala_atribuida":pd.NA  # only for coordenadores
             })
-        pd.DataFrame(rows).to_csv(USERS_CSV,index=False)
-    return pd.read_csv(USERS_CSV)
+        _gravar_csv(novas_linhas("users", rows), caminho(USERS_CSV))
+    return carregar_tabela(caminho(USERS_CSV), "users")
 
 def save_users(df):
-    df.to_csv(USERS_CSV,index=False)
+    salvar_tabela(df, caminho(USERS_CSV))
+    marcar_alterado("users")
 
 def ensure_rooms():
     ensure_data_dir()
-    if not os.path.exists(ROOMS_CSV):
+    if not os.path.exists(caminho(ROOMS_CSV)):
         rows=[]
-        for sala,equipe in [(1,"Hidrossanitário"),(2,"Hidrossanitário"),(3,"Elétrica"),(4,"Elétrica")]:
+        equipes = [d for d in disciplinas_empresa() for _ in range(SALAS_POR_DISCIPLINA_DEFAULT)]
+        for sala,equipe in enumerate(equipes, start=1):
             rows.append({"Sala":int(sala),"Equipe":equipe,"Vagas":int(VAGAS_POR_SALA_DEFAULT)})
-        pd.DataFrame(rows).to_csv(ROOMS_CSV,index=False)
-    return pd.read_csv(ROOMS_CSV)
+        _gravar_csv(novas_linhas("rooms", rows), caminho(ROOMS_CSV))
+    return carregar_tabela(caminho(ROOMS_CSV), "rooms")
 
 def save_rooms(df):
-    df.to_csv(ROOMS_CSV,index=False)
+    salvar_tabela(df, caminho(ROOMS_CSV))
+    marcar_alterado("rooms")
 
 def ensure_projetistas():
     ensure_data_dir()
-    if not os.path.exists(PROJ_CSV):
+    if not os.path.exists(caminho(PROJ_CSV)):
         rooms = ensure_rooms()
         rows=[]
         for _,r in rooms.iterrows():
             for _ in range(int(r["Vagas"])):
                 rows.append({"Sala":int(r["Sala"]),"Equipe":r["Equipe"],"Classe":"-","Projetista":"-","Pontuação":0,"Status":"Ativo"})
-        pd.DataFrame(rows).to_csv(PROJ_CSV,index=False)
-    return pd.read_csv(PROJ_CSV)
+        _gravar_csv(novas_linhas("projetistas", rows), caminho(PROJ_CSV))
+    return carregar_tabela(caminho(PROJ_CSV), "projetistas")
 
 def save_projetistas(df):
-    df.to_csv(PROJ_CSV,index=False)
+    salvar_tabela(df, caminho(PROJ_CSV))
+    marcar_alterado("projetistas")
 
 def ensure_historico():
     ensure_data_dir()
-    if not os.path.exists(HIST_CSV):
-        pd.DataFrame(columns=["Timestamp","Disciplina","Demanda","Projetista","Parâmetro","Nota","Resumo","PontosAtribuídos"]).to_csv(HIST_CSV,index=False)
-    return pd.read_csv(HIST_CSV, parse_dates=["Timestamp"])
+    if not os.path.exists(caminho(HIST_CSV)):
+        _gravar_csv(pd.DataFrame(columns=list(SCHEMAS["historico"])), caminho(HIST_CSV))
+    return carregar_tabela(caminho(HIST_CSV), "historico")
 
 def save_historico(df):
-    df.to_csv(HIST_CSV,index=False)
+    salvar_tabela(df, caminho(HIST_CSV))
+    marcar_alterado("historico")
 
 def ensure_log():
     ensure_data_dir()
-    if not os.path.exists(LOG_CSV):
-        pd.DataFrame(columns=["timestamp","usuario","role","acao","detalhes"]).to_csv(LOG_CSV,index=False)
+    if not os.path.exists(caminho(LOG_CSV)):
+        _gravar_csv(pd.DataFrame(columns=list(SCHEMAS["log"])), caminho(LOG_CSV))
 
 def registrar_log(usuario, role, acao, detalhes=""):
     ensure_log()
-    df = pd.read_csv(LOG_CSV)
+    df = carregar_tabela(caminho(LOG_CSV), "log")
     nova = {"timestamp":datetime.now().isoformat(), "usuario":usuario, "role":role, "acao":acao, "detalhes":detalhes}
-    df = pd.concat([pd.DataFrame([nova]), df], ignore_index=True)
-    df.to_csv(LOG_CSV,index=False)
+    df = pd.concat([novas_linhas("log", [nova]), df], ignore_index=True)
+    salvar_tabela(df, caminho(LOG_CSV))
 
 def ensure_inativos():
     ensure_data_dir()
-    if not os.path.exists(INATIVOS_CSV):
-        pd.DataFrame(columns=["Projetista","Pontuacao","RemovidoEm"]).to_csv(INATIVOS_CSV,index=False)
-    return pd.read_csv(INATIVOS_CSV)
+    if not os.path.exists(caminho(INATIVOS_CSV)):
+        _gravar_csv(pd.DataFrame(columns=list(SCHEMAS["inativos"])), caminho(INATIVOS_CSV))
+    return carregar_tabela(caminho(INATIVOS_CSV), "inativos")
 
 def save_inativos(df):
-    df.to_csv(INATIVOS_CSV,index=False)
+    salvar_tabela(df, caminho(INATIVOS_CSV))
+    marcar_alterado("inativos")
+
+# ---------------- Histórico: arquivo (segmentos mensais) ----------------
+def _segmentos_historico(mes=None):
+    d = caminho(HIST_ARQUIVO_DIR)
+    if not os.path.isdir(d):
+        return []
+    prefixo = f"historico_{mes}" if mes else "historico_"
+    return sorted(os.path.join(d,a) for a in os.listdir(d) if a.startswith(prefixo) and a.endswith((".parquet",".csv.gz")))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _ler_segmento(path, carimbo):
+    # segmentos nunca são reescritos; o carimbo só invalida se alguém trocar o arquivo manualmente
+    if path.endswith(".parquet"):
+        return _coagir(pd.read_parquet(path), "historico")
+    return ler_csv(path, "historico")
+
+def _gravar_segmento(df, mes):
+    d = caminho(HIST_ARQUIVO_DIR)
+    os.makedirs(d, exist_ok=True)
+    base = os.path.join(d, f"historico_{mes}")
+    path, n = base + SEGMENTO_EXT, 1
+    while os.path.exists(path):  # mês já arquivado: novo segmento, o existente fica intacto
+        n += 1
+        path = f"{base}_{n}{SEGMENTO_EXT}"
+    tmp = path + ".tmp"
+    if SEGMENTO_EXT == ".parquet":
+        df.to_parquet(tmp, compression="zstd", index=False)  # strings repetidas ficam em dicionário por coluna
+    else:
+        df.to_csv(tmp, index=False, compression="gzip")
+    os.replace(tmp, path)
+
+def _chaves_historico(df):
+    return pd.util.hash_pandas_object(df[list(SCHEMAS["historico"])].astype(str), index=False)
+
+def arquivar_historico():
+    # move as linhas anteriores à janela quente para segmentos mensais e devolve o histórico quente
+    corte = pd.Timestamp.now().normalize().replace(day=1) - pd.DateOffset(months=JANELA_HISTORICO_MESES)
+    with _cache_empresas()["arquivo_lock"]:
+        hist = ensure_historico()
+        antigos = hist["Timestamp"] < corte
+        if not antigos.any():
+            return hist
+        frios = hist[antigos].copy()
+        # o sufixo de inativo é reaplicado na leitura (ver historico_completo): segmentos não mudam ao reativar
+        frios["Projetista"] = frios["Projetista"].str.removesuffix(SUFIXO_INATIVO)
+        for mes, g in frios.groupby(frios["Timestamp"].dt.strftime("%Y-%m")):
+            existentes = [_ler_segmento(p, _carimbo(p)) for p in _segmentos_historico(mes)]
+            if existentes:
+                # linhas que outra sessão regravou no arquivo quente depois de já arquivadas
+                g = g[~_chaves_historico(g).isin(_chaves_historico(pd.concat(existentes)))]
+            if not g.empty:
+                _gravar_segmento(g, mes)
+        hist = hist[~antigos].reset_index(drop=True)
+        save_historico(hist)
+        return hist
+
+def historico_completo():
+    # histórico quente da sessão + segmentos arquivados (relatórios e backup)
+    partes = [_ler_segmento(p, _carimbo(p)) for p in _segmentos_historico()]
+    if not partes:
+        return st.session_state.historico
+    frio = pd.concat(partes, ignore_index=True).sort_values("Timestamp", ascending=False)
+    inativo = frio["Projetista"].isin(st.session_state.inativos["Projetista"])
+    frio.loc[inativo,"Projetista"] = frio.loc[inativo,"Projetista"] + SUFIXO_INATIVO
+    return pd.concat([st.session_state.historico, frio], ignore_index=True)
+
+def descartar_arquivo_historico():
+    # importar backup substitui todos os dados; o arquivo anterior é renomeado, não apagado.
+    # Devolve o novo caminho (None se não havia arquivo) para o desfazer poder restaurá-lo
+    d = caminho(HIST_ARQUIVO_DIR)
+    if not os.path.isdir(d):
+        return None
+    destino = f"{d}_substituido_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    with _cache_empresas()["arquivo_lock"]:
+        os.replace(d, destino)
+    return destino
+
+def restaurar_arquivo_historico(guardado):
+    # desfazer de um import: apaga o arquivo gerado a partir do backup e devolve o anterior
+    apagar_arquivo_guardado(descartar_arquivo_historico())
+    if guardado and os.path.isdir(guardado):
+        with _cache_empresas()["arquivo_lock"]:
+            os.replace(guardado, caminho(HIST_ARQUIVO_DIR))
+
+def apagar_arquivo_guardado(guardado):
+    if guardado and os.path.isdir(guardado):
+        shutil.rmtree(guardado, ignore_errors=True)
+
+def descartar_snapshot():
+    # o arquivo guardado por um import só serve para o desfazer: sai junto com o snapshot
+    apagar_arquivo_guardado((st.session_state.get("_last") or {}).get("arquivo_historico"))
+    st.session_state._last = None
 
 # ---------------- Helpers de regras ----------------
 def pontos_por_nota(n):
@@ -194,6 +526,8 @@ def pontos_por_nota(n):
     return 0
 
 def calcular_rankings():
+    if st.session_state.get("_rank_versao") == versao_dados("projetistas"):
+        return  # RankingClasse já calculado para esta versão do quadro
     df = st.session_state.projetistas.copy()
     df["RankingClasse"] = "-"
     for classe in CLASSES:
@@ -202,25 +536,41 @@ def calcular_rankings():
         subset = subset.sort_values("Pontuação", ascending=False).reset_index()
         for rank, idx in enumerate(subset["index"], start=1):
             if df.at[idx,"Pontuação"]>0:
-                df.at[idx,"RankingClasse"] = rank
+                df.at[idx,"RankingClasse"] = str(rank)
             else:
                 df.at[idx,"RankingClasse"] = "-"
     st.session_state.projetistas = df
+    st.session_state._rank_versao = versao_dados("projetistas")
 
 # ---------------- Init session state ----------------
-if "initialized" not in st.session_state:
+def carregar_dados_empresa():
     st.session_state.users = ensure_users()
     st.session_state.rooms = ensure_rooms()
     st.session_state.projetistas = ensure_projetistas()
-    st.session_state.historico = ensure_historico()
+    st.session_state.historico = arquivar_historico()
     ensure_log()
     st.session_state.inativos = ensure_inativos()
+    marcar_alterado("users","rooms","projetistas","historico","inativos")
+
+EMPRESAS = carregar_empresas()
+if "empresa" not in st.session_state:
+    emp = st.query_params.get("empresa", EMPRESA_PADRAO)
+    st.session_state.empresa = emp if emp in EMPRESAS["empresa"].values else EMPRESA_PADRAO
+
+if "initialized" not in st.session_state:
+    carregar_dados_empresa()
     st.session_state.current_user = None
     st.session_state._last = None
     st.session_state.initialized = True
+elif empresa_atual() not in EMPRESAS["empresa"].values and not st.session_state.current_user:
+    # empresa removida de empresas.csv desde o último acesso: volta para a padrão
+    st.session_state.empresa = EMPRESA_PADRAO
+    descartar_snapshot()
+    carregar_dados_empresa()
 
 # snapshot for undo
 def salvar_snapshot():
+    descartar_snapshot()
     st.session_state._last = {
         "users": st.session_state.users.copy(deep=True),
         "rooms": st.session_state.rooms.copy(deep=True),
@@ -239,26 +589,30 @@ def desfazer_snapshot():
     st.session_state.projetistas = s["projetistas"]
     st.session_state.historico = s["historico"]
     st.session_state.inativos = s["inativos"]
+    if "arquivo_historico" in s:  # a ação desfeita foi um import de backup
+        restaurar_arquivo_historico(s["arquivo_historico"])
     save_users(st.session_state.users)
     save_rooms(st.session_state.rooms)
     save_projetistas(st.session_state.projetistas)
     save_historico(st.session_state.historico)
     save_inativos(st.session_state.inativos)
-    st.success("Última ação desfeita.")
-    st.session_state._last = None
+    descartar_snapshot()
+    concluir("Última ação desfeita.")
 
 # ---------------- UI Top ----------------
 st.title("Painel de Avaliação - Etapa 3 (Gestão Integrada)")
 st.markdown("Sistema com autenticação, perfis, salas dinâmicas, demandas, ranking, logs e reativação preservando pontuação.")
 
+flash = st.session_state.pop("_flash", None)
+if flash:
+    st.success(flash["msg"])
+    if flash["download"]:
+        st.download_button(**flash["download"])
+
 colL, colR = st.columns([3,1])
 with colR:
     if st.button("Recarregar dados"):
-        st.session_state.users = ensure_users()
-        st.session_state.rooms = ensure_rooms()
-        st.session_state.projetistas = ensure_projetistas()
-        st.session_state.historico = ensure_historico()
-        st.session_state.inativos = ensure_inativos()
+        carregar_dados_empresa()
         st.success("Dados recarregados. Refaça login se necessário.")
 with colL:
     st.info("Diretor/Gerente podem criar salas; Coordenadores são atribuídos a UMA sala; Projetistas podem avaliar o coordenador da sua sala.")
@@ -266,84 +620,100 @@ with colL:
 # ---------------- Sidebar: Login & Registration ----------------
 st.sidebar.header("Acesso")
 
-if st.session_state.current_user:
-    cu = st.session_state.current_user
-    st.sidebar.success(f"Logado: {cu['nome']} — {cu['role']}")
-    if st.sidebar.button("Logout"):
-        registrar_log(cu["usuario"], cu["role"], "LOGOUT", "Logout efetuado")
-        st.session_state.current_user = None
+if len(EMPRESAS) > 1 and not st.session_state.current_user:
+    nomes_empresas = dict(zip(EMPRESAS["empresa"], EMPRESAS["nome"]))
+    opts_empresa = EMPRESAS["empresa"].tolist()
+    escolha = st.sidebar.selectbox("Empresa", options=opts_empresa, index=opts_empresa.index(empresa_atual()), format_func=lambda e: nomes_empresas.get(e) or e)
+    if escolha != empresa_atual():
+        st.session_state.empresa = escolha
+        st.query_params["empresa"] = escolha
+        descartar_snapshot()
+        carregar_dados_empresa()
         rerun_safe()
-else:
-    st.sidebar.subheader("Entrar")
-    user_in = st.sidebar.text_input("Usuário", key="login_user")
-    pw_in = st.sidebar.text_input("Senha", type="password", key="login_pw")
-    if st.sidebar.button("Entrar"):
-        dfu = st.session_state.users
-        row = dfu[dfu["usuario"]==user_in.strip()]
-        if row.empty:
-            st.sidebar.error("Usuário não encontrado.")
-        else:
-            row = row.iloc[0]
-            if not bool(row["ativo"]):
-                st.sidebar.error("Conta inativa.")
-            elif hash_password(pw_in) == row["senha_hash"]:
-                st.session_state.current_user = {"usuario":row["usuario"], "nome":row["nome"], "role":row["role"], "cor_tema":row.get("cor_tema",""), "sala_atribuida": row.get("sala_atribuida","")}
-                st.session_state.users.loc[st.session_state.users["usuario"]==row["usuario"], "ultimo_login"] = datetime.now().isoformat()
-                save_users(st.session_state.users)
-                registrar_log(row["usuario"], row["role"], "LOGIN", "Login bem-sucedido")
-                rerun_safe()
-            else:
-                st.sidebar.error("Senha incorreta.")
-                registrar_log(user_in.strip(), "", "LOGIN_FALHOU", "Senha incorreta")
-
-    st.sidebar.markdown("---")
-    st.sidebar.subheader("Registrar conta (Projetista)")
-    ru = st.sidebar.text_input("Usuário (login)", key="reg_user")
-    rn = st.sidebar.text_input("Nome completo", key="reg_name")
-    rp = st.sidebar.text_input("Senha", type="password", key="reg_pw")
-    rcor = st.sidebar.text_input("Cor tema (opcional)", key="reg_cor")
-    if st.sidebar.button("Criar conta Projetista"):
-        if not ru.strip() or not rn.strip() or not rp:
-            st.sidebar.warning("Preencha usuário, nome e senha.")
-        else:
-            if ru.strip() in st.session_state.users["usuario"].values:
-                st.sidebar.error("Usuário já existe.")
+
+@fragmento
+def painel_acesso():
+    if st.session_state.current_user:
+        cu = st.session_state.current_user
+        st.success(f"Logado: {cu['nome']} — {cu['role']}")
+        if st.button("Logout"):
+            registrar_log(cu["usuario"], cu["role"], "LOGOUT", "Logout efetuado")
+            st.session_state.current_user = None
+            rerun_safe()
+    else:
+        st.subheader("Entrar")
+        user_in = st.text_input("Usuário", key="login_user")
+        pw_in = st.text_input("Senha", type="password", key="login_pw")
+        if st.button("Entrar"):
+            dfu = st.session_state.users
+            row = dfu[dfu["usuario"]==user_in.strip()]
+            if row.empty:
+                st.error("Usuário não encontrado.")
             else:
-                salvar_snapshot()
-                new = {"usuario":ru.strip(),"nome":rn.strip(),"role":"Projetista","senha_hash":hash_password(rp),"cor_tema":rcor,"ativo":True,"criado_em":datetime.now().isoformat(),"ultimo_login":"","sala_atribuida":""}
-                st.session_state.users = pd.concat([st.session_state.users, pd.DataFrame([new])], ignore_index=True)
-                save_users(st.session_state.users)
-                registrar_log(ru.strip(),"Projetista","CRIAR_USUARIO","Conta Projetista criada por auto-registro")
-                st.sidebar.success("Conta criada. Faça login.")
-
-    st.sidebar.markdown("---")
-    st.sidebar.subheader("Solicitar Conta (Coordenador)")
-    cu_user = st.sidebar.text_input("Usuário (login) - Coordenador", key="req_coord_user")
-    cu_name = st.sidebar.text_input("Nome completo - Coordenador", key="req_coord_name")
-    cu_pw = st.sidebar.text_input("Senha - Coordenador", type="password", key="req_coord_pw")
-    cu_cor = st.sidebar.text_input("Cor tema (opcional) - Coordenador", key="req_coord_cor")
-    auth_pw = st.sidebar.text_input("Senha autorização Diretor (necessária)", type="password", key="req_coord_auth")
-    if st.sidebar.button("Solicitar criação Coordenador"):
-        if not cu_user.strip() or not cu_name.strip() or not cu_pw:
-            st.sidebar.warning("Preencha os campos.")
-        else:
-            authorized = False; executor=None
-            for _,r in st.session_state.users[st.session_state.users["role"]=="Diretor"].iterrows():
-                if hash_password(auth_pw) == r["senha_hash"]:
-                    authorized = True; executor = r["usuario"]; break
-            if not authorized:
-                st.sidebar.error("Autorização negada.")
-                registrar_log(cu_user.strip(),"Solicitante","CRIAR_COORDENADOR_FALHOU","Autorização inválida")
+                row = row.iloc[0]
+                if not bool(row["ativo"]):
+                    st.error("Conta inativa.")
+                elif hash_password(pw_in) == row["senha_hash"]:
+                    st.session_state.current_user = {"usuario":row["usuario"], "nome":row["nome"], "role":row["role"], "cor_tema":row.get("cor_tema",""), "sala_atribuida": None if pd.isna(row["sala_atribuida"]) else int(row["sala_atribuida"])}
+                    st.session_state.users.loc[st.session_state.users["usuario"]==row["usuario"], "ultimo_login"] = datetime.now().isoformat()
+                    save_users(st.session_state.users)
+                    registrar_log(row["usuario"], row["role"], "LOGIN", "Login bem-sucedido")
+                    rerun_safe()
+                else:
+                    st.error("Senha incorreta.")
+                    registrar_log(user_in.strip(), "", "LOGIN_FALHOU", "Senha incorreta")
+
+        st.markdown("---")
+        st.subheader("Registrar conta (Projetista)")
+        ru = st.text_input("Usuário (login)", key="reg_user")
+        rn = st.text_input("Nome completo", key="reg_name")
+        rp = st.text_input("Senha", type="password", key="reg_pw")
+        rcor = st.text_input("Cor tema (opcional)", key="reg_cor")
+        if st.button("Criar conta Projetista"):
+            if not ru.strip() or not rn.strip() or not rp:
+                st.warning("Preencha usuário, nome e senha.")
             else:
-                if cu_user.strip() in st.session_state.users["usuario"].values:
-                    st.sidebar.error("Usuário já existe.")
+                if ru.strip() in st.session_state.users["usuario"].values:
+                    st.error("Usuário já existe.")
                 else:
                     salvar_snapshot()
-                    new = {"usuario":cu_user.strip(),"nome":cu_name.strip(),"role":"Coordenador","senha_hash":hash_password(cu_pw),"cor_tema":cu_cor,"ativo":True,"criado_em":datetime.now().isoformat(),"ultimo_login":"","sala_atribuida":""}
-                    st.session_state.users = pd.concat([st.session_state.users, pd.DataFrame([new])], ignore_index=True)
+                    new = {"usuario":ru.strip(),"nome":rn.strip(),"role":"Projetista","senha_hash":hash_password(rp),"cor_tema":rcor,"ativo":True,"criado_em":datetime.now().isoformat(),"ultimo_login":"","sala_atribuida":pd.NA}
+                    st.session_state.users = pd.concat([st.session_state.users, novas_linhas("users", [new])], ignore_index=True)
                     save_users(st.session_state.users)
-                    registrar_log(executor,"Diretor","CRIAR_COORDENADOR",f"{cu_user.strip()} criado")
-                    st.sidebar.success("Conta de Coordenador criada (atribuir sala via Painel de Perfis).")
+                    registrar_log(ru.strip(),"Projetista","CRIAR_USUARIO","Conta Projetista criada por auto-registro")
+                    st.success("Conta criada. Faça login.")
+
+        st.markdown("---")
+        st.subheader("Solicitar Conta (Coordenador)")
+        cu_user = st.text_input("Usuário (login) - Coordenador", key="req_coord_user")
+        cu_name = st.text_input("Nome completo - Coordenador", key="req_coord_name")
+        cu_pw = st.text_input("Senha - Coordenador", type="password", key="req_coord_pw")
+        cu_cor = st.text_input("Cor tema (opcional) - Coordenador", key="req_coord_cor")
+        auth_pw = st.text_input("Senha autorização Diretor (necessária)", type="password", key="req_coord_auth")
+        if st.button("Solicitar criação Coordenador"):
+            if not cu_user.strip() or not cu_name.strip() or not cu_pw:
+                st.warning("Preencha os campos.")
+            else:
+                authorized = False; executor=None
+                for _,r in st.session_state.users[st.session_state.users["role"]=="Diretor"].iterrows():
+                    if hash_password(auth_pw) == r["senha_hash"]:
+                        authorized = True; executor = r["usuario"]; break
+                if not authorized:
+                    st.error("Autorização negada.")
+                    registrar_log(cu_user.strip(),"Solicitante","CRIAR_COORDENADOR_FALHOU","Autorização inválida")
+                else:
+                    if cu_user.strip() in st.session_state.users["usuario"].values:
+                        st.error("Usuário já existe.")
+                    else:
+                        salvar_snapshot()
+                        new = {"usuario":cu_user.strip(),"nome":cu_name.strip(),"role":"Coordenador","senha_hash":hash_password(cu_pw),"cor_tema":cu_cor,"ativo":True,"criado_em":datetime.now().isoformat(),"ultimo_login":"","sala_atribuida":pd.NA}
+                        st.session_state.users = pd.concat([st.session_state.users, novas_linhas("users", [new])], ignore_index=True)
+                        save_users(st.session_state.users)
+                        registrar_log(executor,"Diretor","CRIAR_COORDENADOR",f"{cu_user.strip()} criado")
+                        st.success("Conta de Coordenador criada (atribuir sala via Painel de Perfis).")
+
+with st.sidebar:
+    painel_acesso()
 
 # ---------------- Main area after login ----------------
 def aplicar_tema_usuario():
@@ -355,16 +725,9 @@ def aplicar_tema_usuario():
         css = f"<style>.stApp {{ --primary: {c}; }} h1,h2,h3, .css-18e3th9 {{ color: {c} !important; }}</style>"
         st.markdown(css, unsafe_allow_html=True)
 
-if st.session_state.current_user:
-    aplicar_tema_usuario()
-    cu = st.session_state.current_user
-    st.header(f"Olá, {cu['nome']} — {cu['role']}")
-    st.markdown(f"**Usuário:** `{cu['usuario']}`  •  **Sala atribuída:** `{cu.get('sala_atribuida','(nenhuma)')}`")
-
-    role = cu["role"]
-
-    # common actions: undo, backup, import
-    st.markdown("---")
+# common actions: undo, backup, import
+@fragmento
+def acoes_comuns(cu, role):
     c1,c2,c3 = st.columns([1,1,2])
     with c1:
         if st.button("↩️ Desfazer última ação"):
@@ -375,9 +738,9 @@ if st.session_state.current_user:
             with zipfile.ZipFile(buffer,"w",zipfile.ZIP_DEFLATED) as zf:
                 zf.writestr("users.csv", st.session_state.users.to_csv(index=False))
                 zf.writestr("projetistas.csv", st.session_state.projetistas.to_csv(index=False))
-                zf.writestr("historico_demandas.csv", st.session_state.historico.to_csv(index=False))
+                zf.writestr("historico_demandas.csv", historico_completo().to_csv(index=False))
                 zf.writestr("salas.csv", st.session_state.rooms.to_csv(index=False))
-                zf.writestr("log_gestao.csv", pd.read_csv(LOG_CSV).to_csv(index=False))
+                zf.writestr("log_gestao.csv", carregar_tabela(caminho(LOG_CSV), "log").to_csv(index=False))
                 zf.writestr("inativos.csv", st.session_state.inativos.to_csv(index=False))
             buffer.seek(0)
             fname = f"{BACKUP_NAME_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
@@ -385,292 +748,402 @@ if st.session_state.current_user:
             registrar_log(cu["usuario"], role, "BACKUP_MANUAL", f"Backup gerado {fname}")
     with c3:
         uploaded = st.file_uploader("📂 Importar Backup (ZIP)", type=["zip"])
-        if uploaded:
+        # o uploader mantém o arquivo entre reruns: importar cada upload uma vez só
+        if uploaded and st.session_state.get("_backup_importado") != uploaded.file_id:
             try:
                 z = zipfile.ZipFile(io.BytesIO(uploaded.read()))
                 names = z.namelist()
                 required = {"users.csv","projetistas.csv","historico_demandas.csv","salas.csv"}
                 if required.issubset(set(names)):
                     salvar_snapshot()
-                    st.session_state.users = pd.read_csv(z.open("users.csv"))
-                    st.session_state.projetistas = pd.read_csv(z.open("projetistas.csv"))
-                    st.session_state.historico = pd.read_csv(z.open("historico_demandas.csv"), parse_dates=["Timestamp"])
-                    st.session_state.rooms = pd.read_csv(z.open("salas.csv"))
-                    if "inativos.csv" in names:
-                        st.session_state.inativos = pd.read_csv(z.open("inativos.csv"))
+                    # valida tudo antes de substituir o estado (backup inválido não deixa dados pela metade)
+                    users = ler_csv(z.open("users.csv"), "users")
+                    projetistas = ler_csv(z.open("projetistas.csv"), "projetistas")
+                    historico = ler_csv(z.open("historico_demandas.csv"), "historico")
+                    rooms = ler_csv(z.open("salas.csv"), "rooms")
+                    inativos = ler_csv(z.open("inativos.csv"), "inativos") if "inativos.csv" in names else st.session_state.inativos
+                    st.session_state.users = users
+                    st.session_state.projetistas = projetistas
+                    st.session_state.historico = historico
+                    st.session_state.rooms = rooms
+                    st.session_state.inativos = inativos
                     save_users(st.session_state.users); save_projetistas(st.session_state.projetistas)
                     save_historico(st.session_state.historico); save_rooms(st.session_state.rooms)
                     save_inativos(st.session_state.inativos)
+                    st.session_state._last["arquivo_historico"] = descartar_arquivo_historico()
+                    st.session_state.historico = arquivar_historico()
+                    st.session_state._backup_importado = uploaded.file_id
                     registrar_log(cu["usuario"], role, "IMPORT_BACKUP", "Backup importado")
-                    st.success("Backup importado e dados atualizados.")
-                    rerun_safe()
+                    concluir("Backup importado e dados atualizados.")
                 else:
                     st.error("ZIP inválido (faltam CSVs obrigatórios).")
             except Exception as e:
                 st.error(f"Erro ao ler ZIP: {e}")
 
-    st.markdown("---")
+# ========= DIRETOR / GERENTE =========
+@fragmento
+def admin_salas(cu, role):
+    with st.expander("🧱 Salas (Criar / Editar)", expanded=True):
+        st.write("Salas:")
+        st.dataframe(st.session_state.rooms, use_container_width=True)
+        new_equipe = st.selectbox("Equipe (nova sala)", options=disciplinas_empresa(), key="new_room_equipe")
+        new_num = st.number_input("Número da sala", min_value=1, value=int(st.session_state.rooms["Sala"].max()+1), key="new_room_num")
+        new_vagas = st.number_input("Vagas", min_value=1, max_value=20, value=VAGAS_POR_SALA_DEFAULT, key="new_room_vagas")
+        if st.button("Criar sala"):
+            if int(new_num) in st.session_state.rooms["Sala"].values:
+                st.warning("Número de sala já existe.")
+            else:
+                salvar_snapshot()
+                st.session_state.rooms = pd.concat([st.session_state.rooms, novas_linhas("rooms", [{"Sala":int(new_num),"Equipe":new_equipe,"Vagas":int(new_vagas)}])], ignore_index=True)
+                # add vagas to projetistas DF
+                vagas_novas = [{"Sala":int(new_num),"Equipe":new_equipe,"Classe":"-","Projetista":"-","Pontuação":0,"Status":"Ativo"}]*int(new_vagas)
+                st.session_state.projetistas = pd.concat([st.session_state.projetistas, novas_linhas("projetistas", vagas_novas)], ignore_index=True)
+                save_rooms(st.session_state.rooms); save_projetistas(st.session_state.projetistas)
+                registrar_log(cu["usuario"], role, "CRIAR_SALA", f"Sala {new_num} ({new_equipe}) com {new_vagas} vagas")
+                concluir("Sala criada com sucesso.")
 
-    # ========= DIRETOR / GERENTE VIEW =========
-    if role in ["Diretor","Gerente"]:
-        st.subheader("Administração Geral")
-        # Rooms
-        with st.expander("🧱 Salas (Criar / Editar)", expanded=True):
-            st.write("Salas:")
-            st.dataframe(st.session_state.rooms, use_container_width=True)
-            new_equipe = st.selectbox("Equipe (nova sala)", options=DISCIPLINAS, key="new_room_equipe")
-            new_num = st.number_input("Número da sala", min_value=1, value=int(st.session_state.rooms["Sala"].max()+1), key="new_room_num")
-            new_vagas = st.number_input("Vagas", min_value=1, max_value=20, value=VAGAS_POR_SALA_DEFAULT, key="new_room_vagas")
-            if st.button("Criar sala"):
-                if int(new_num) in st.session_state.rooms["Sala"].values:
-                    st.warning("Número de sala já existe.")
-                else:
-                    salvar_snapshot()
-                    st.session_state.rooms = pd.concat([st.session_state.rooms, pd.DataFrame([{"Sala":int(new_num),"Equipe":new_equipe,"Vagas":int(new_vagas)}])], ignore_index=True)
-                    # add vagas to projetistas DF
-                    for _ in range(int(new_vagas)):
-                        st.session_state.projetistas = pd.concat([st.session_state.projetistas, pd.DataFrame([{"Sala":int(new_num),"Equipe":new_equipe,"Classe":"-","Projetista":"-","Pontuação":0,"Status":"Ativo"}])], ignore_index=True)
-                    save_rooms(st.session_state.rooms); save_projetistas(st.session_state.projetistas)
-                    registrar_log(cu["usuario"], role, "CRIAR_SALA", f"Sala {new_num} ({new_equipe}) com {new_vagas} vagas")
-                    st.success("Sala criada com sucesso.")
-
-        # Profiles management
-        st.subheader("Perfis (Gerenciar usuários)")
-        dfu = st.session_state.users.copy()
-        st.dataframe(dfu[["usuario","nome","role","ativo","criado_em","ultimo_login","sala_atribuida"]], use_container_width=True)
-        st.markdown("Ações sobre contas:")
-        col1,col2,col3 = st.columns(3)
-        with col1:
-            sel = st.selectbox("Selecionar usuário", options=dfu["usuario"].tolist(), key="admin_sel")
-        with col2:
-            action = st.selectbox("Ação", options=["Ativar","Desativar","Resetar senha","Promover para Coordenador","Atribuir Sala"], key="admin_action")
-        with col3:
-            if action=="Resetar senha":
-                newpw = st.text_input("Nova senha", key="admin_newpw")
-            elif action=="Atribuir Sala":
-                salas_opts = st.session_state.rooms["Sala"].tolist()
-                atrib_sala = st.selectbox("Sala", options=salas_opts, key="admin_atrib_sala")
+@fragmento
+def admin_perfis(cu, role):
+    st.subheader("Perfis (Gerenciar usuários)")
+    dfu = memo("perfis", ("users",), lambda: st.session_state.users[["usuario","nome","role","ativo","criado_em","ultimo_login","sala_atribuida"]])
+    st.dataframe(dfu, use_container_width=True)
+    st.markdown("Ações sobre contas:")
+    col1,col2,col3 = st.columns(3)
+    with col1:
+        sel = st.selectbox("Selecionar usuário", options=dfu["usuario"].tolist(), key="admin_sel")
+    with col2:
+        action = st.selectbox("Ação", options=["Ativar","Desativar","Resetar senha","Promover para Coordenador","Atribuir Sala"], key="admin_action")
+    with col3:
+        if action=="Resetar senha":
+            newpw = st.text_input("Nova senha", key="admin_newpw")
+        elif action=="Atribuir Sala":
+            salas_opts = st.session_state.rooms["Sala"].tolist()
+            atrib_sala = st.selectbox("Sala", options=salas_opts, key="admin_atrib_sala")
+        else:
+            newpw=None; atrib_sala=None
+    if st.button("Executar ação"):
+        salvar_snapshot()
+        executor = cu["usuario"]
+        if action=="Ativar":
+            st.session_state.users.loc[st.session_state.users["usuario"]==sel,"ativo"]=True
+            save_users(st.session_state.users)
+            registrar_log(executor, role, "ATIVAR_USUARIO", sel)
+            concluir("Usuário ativado.")
+        elif action=="Desativar":
+            if sel==executor and role=="Diretor":
+                st.error("Diretor não pode desativar a si mesmo.")
             else:
-                newpw=None; atrib_sala=None
-        if st.button("Executar ação"):
-            salvar_snapshot()
-            executor = cu["usuario"]
-            if action=="Ativar":
-                st.session_state.users.loc[st.session_state.users["usuario"]==sel,"ativo"]=True
+                st.session_state.users.loc[st.session_state.users["usuario"]==sel,"ativo"]=False
                 save_users(st.session_state.users)
-                registrar_log(executor, role, "ATIVAR_USUARIO", sel)
-                st.success("Usuário ativado.")
-            elif action=="Desativar":
-                if sel==executor and role=="Diretor":
-                    st.error("Diretor não pode desativar a si mesmo.")
-                else:
-                    st.session_state.users.loc[st.session_state.users["usuario"]==sel,"ativo"]=False
-                    save_users(st.session_state.users)
-                    registrar_log(executor, role, "DESATIVAR_USUARIO", sel)
-                    st.success("Usuário desativado.")
-            elif action=="Resetar senha":
-                if not newpw:
-                    st.error("Informe nova senha.")
-                else:
-                    st.session_state.users.loc[st.session_state.users["usuario"]==sel,"senha_hash"]=hash_password(newpw)
-                    save_users(st.session_state.users)
-                    registrar_log(executor, role, "RESET_SENHA", f"{sel} nova senha")
-                    st.success("Senha redefinida.")
-            elif action=="Promover para Coordenador":
-                st.session_state.users.loc[st.session_state.users["usuario"]==sel,"role"]="Coordenador"
+                registrar_log(executor, role, "DESATIVAR_USUARIO", sel)
+                concluir("Usuário desativado.")
+        elif action=="Resetar senha":
+            if not newpw:
+                st.error("Informe nova senha.")
+            else:
+                st.session_state.users.loc[st.session_state.users["usuario"]==sel,"senha_hash"]=hash_password(newpw)
                 save_users(st.session_state.users)
-                registrar_log(executor, role, "PROMOVER", f"{sel} promovido a Coordenador")
-                st.success("Usuário promovido a Coordenador.")
-            elif action=="Atribuir Sala":
-                if atrib_sala is None:
-                    st.error("Selecione sala.")
-                else:
-                    st.session_state.users.loc[st.session_state.users["usuario"]==sel,"sala_atribuida"]=int(atrib_sala)
-                    save_users(st.session_state.users)
-                    registrar_log(executor, role, "ATRIBUIR_SALA", f"{sel} -> sala {atrib_sala}")
-                    st.success("Sala atribuída.")
+                registrar_log(executor, role, "RESET_SENHA", f"{sel} nova senha")
+                st.success("Senha redefinida.")
+        elif action=="Promover para Coordenador":
+            st.session_state.users.loc[st.session_state.users["usuario"]==sel,"role"]="Coordenador"
+            save_users(st.session_state.users)
+            registrar_log(executor, role, "PROMOVER", f"{sel} promovido a Coordenador")
+            concluir("Usuário promovido a Coordenador.")
+        elif action=="Atribuir Sala":
+            if atrib_sala is None:
+                st.error("Selecione sala.")
+            else:
+                st.session_state.users.loc[st.session_state.users["usuario"]==sel,"sala_atribuida"]=int(atrib_sala)
+                save_users(st.session_state.users)
+                registrar_log(executor, role, "ATRIBUIR_SALA", f"{sel} -> sala {atrib_sala}")
+                concluir("Sala atribuída.")
 
-        # Projetistas global
-        st.markdown("---")
-        st.subheader("Quadro de Projetistas (Global)")
-        calcular_rankings()
-        st.dataframe(st.session_state.projetistas[["Sala","Equipe","Projetista","Classe","Pontuação","Status"]], use_container_width=True)
-
-        st.markdown("Ações rápidas sobre projetista:")
-        cA,cB,cC = st.columns(3)
-        with cA:
-            disc_add = st.selectbox("Equipe ao adicionar", options=DISCIPLINAS, key="addproj_disc")
-            salas_disp = st.session_state.rooms[st.session_state.rooms["Equipe"]==disc_add]["Sala"].tolist()
-            sala_add = st.selectbox("Sala", options=salas_disp, key="addproj_sala")
-            nome_add = st.text_input("Nome projetista (novo)", key="addproj_name")
-            classe_add = st.selectbox("Classe", options=CLASSES, key="addproj_classe")
-            if st.button("Adicionar projetista (global)"):
-                vagas = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==int(sala_add)) & (st.session_state.projetistas["Projetista"]=="-")]
+@fragmento
+def admin_quadro(cu, role):
+    st.subheader("Quadro de Projetistas (Global)")
+    calcular_rankings()
+    st.dataframe(memo("quadro", ("projetistas",), lambda: st.session_state.projetistas[["Sala","Equipe","Projetista","Classe","Pontuação","Status"]]), use_container_width=True)
+
+    st.markdown("Ações rápidas sobre projetista:")
+    cA,cB,cC = st.columns(3)
+    with cA:
+        disc_add = st.selectbox("Equipe ao adicionar", options=disciplinas_empresa(), key="addproj_disc")
+        salas_disp = st.session_state.rooms[st.session_state.rooms["Equipe"]==disc_add]["Sala"].tolist()
+        sala_add = st.selectbox("Sala", options=salas_disp, key="addproj_sala")
+        nome_add = st.text_input("Nome projetista (novo)", key="addproj_name")
+        classe_add = st.selectbox("Classe", options=CLASSES, key="addproj_classe")
+        if st.button("Adicionar projetista (global)"):
+            vagas = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==int(sala_add)) & (st.session_state.projetistas["Projetista"]=="-")]
+            if vagas.empty:
+                st.error("Sala cheia.")
+            else:
+                salvar_snapshot()
+                idx = vagas.index[0]
+                st.session_state.projetistas.loc[idx,["Projetista","Equipe","Classe","Pontuação","Status"]] = [nome_add.strip(), disc_add, classe_add, 0, "Ativo"]
+                save_projetistas(st.session_state.projetistas)
+                registrar_log(cu["usuario"], role, "ADICIONAR_PROJETISTA", f"{nome_add} -> sala {sala_add}")
+                concluir("Projetista adicionado.")
+    with cB:
+        sel_proj = st.selectbox("Selecionar projetista (inativar)", options=st.session_state.projetistas[st.session_state.projetistas["Projetista"]!="-"]["Projetista"].tolist(), key="inativar_sel")
+        if st.button("Gerar relatório e Inativar"):
+            salvar_snapshot()
+            name = sel_proj
+            hist_full = historico_completo()
+            hist_proj = hist_full[hist_full["Projetista"]==name]
+            csvb = hist_proj.to_csv(index=False).encode("utf-8")
+            fn = f"historico_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            # save pontos to inativos
+            proj_idx = st.session_state.projetistas[st.session_state.projetistas["Projetista"]==name].index[0]
+            pontos = int(st.session_state.projetistas.at[proj_idx,"Pontuação"])
+            in_df = st.session_state.inativos
+            in_df = pd.concat([in_df, novas_linhas("inativos", [{"Projetista":name,"Pontuacao":pontos,"RemovidoEm":datetime.now().isoformat()}])], ignore_index=True)
+            st.session_state.inativos = in_df
+            save_inativos(in_df)
+            # mark history entries as Inativo
+            mask = st.session_state.historico["Projetista"]==name
+            st.session_state.historico.loc[mask,"Projetista"] = st.session_state.historico.loc[mask,"Projetista"].apply(lambda x: f"{x} (Inativo)")
+            # remove from quadro (libera vaga) but keep status as '-' in that row
+            st.session_state.projetistas.loc[proj_idx,["Projetista","Classe","Pontuação","Status"]] = ["-","-",0,"Livre"]
+            save_projetistas(st.session_state.projetistas)
+            save_historico(st.session_state.historico)
+            registrar_log(cu["usuario"], role, "INATIVAR_PROJETISTA", f"{name} inativado (pontos salvos: {pontos})")
+            concluir("Projetista inativado e relatório gerado.", download={"label":"⬇️ Baixar relatório do projetista","data":csvb,"file_name":fn,"mime":"text/csv"})
+    with cC:
+        in_candidates = st.session_state.inativos["Projetista"].tolist() if not st.session_state.inativos.empty else []
+        sel_re = st.selectbox("Projetista inativo", options=in_candidates if in_candidates else ["(nenhum)"], key="react_sel")
+        sala_re = st.selectbox("Sala para reativar", options=st.session_state.rooms["Sala"].tolist(), key="react_sala")
+        classe_re = st.selectbox("Classe ao reativar", options=CLASSES, key="react_classe")
+        if st.button("Reativar projetista"):
+            if sel_re == "(nenhum)":
+                st.info("Nenhum inativo disponível.")
+            else:
+                vagas = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==int(sala_re)) & (st.session_state.projetistas["Projetista"]=="-")]
                 if vagas.empty:
-                    st.error("Sala cheia.")
+                    st.error("Sala sem vaga livre.")
                 else:
                     salvar_snapshot()
                     idx = vagas.index[0]
-                    st.session_state.projetistas.loc[idx,["Projetista","Equipe","Classe","Pontuação","Status"]] = [nome_add.strip(), disc_add, classe_add, 0, "Ativo"]
-                    save_projetistas(st.session_state.projetistas)
-                    registrar_log(cu["usuario"], role, "ADICIONAR_PROJETISTA", f"{nome_add} -> sala {sala_add}")
-                    st.success("Projetista adicionado.")
-        with cB:
-            sel_proj = st.selectbox("Selecionar projetista (inativar)", options=st.session_state.projetistas[st.session_state.projetistas["Projetista"]!="-"]["Projetista"].tolist(), key="inativar_sel")
-            if st.button("Gerar relatório e Inativar"):
+                    # restore pontos from inativos
+                    row = st.session_state.inativos[st.session_state.inativos["Projetista"]==sel_re].iloc[0]
+                    pontos_restore = int(row["Pontuacao"])
+                    st.session_state.projetistas.loc[idx, ["Projetista","Classe","Pontuação","Status"]] = [sel_re, classe_re, pontos_restore, "Ativo"]
+                    # remove from inativos
+                    st.session_state.inativos = st.session_state.inativos[st.session_state.inativos["Projetista"]!=sel_re].reset_index(drop=True)
+                    # remove (Inativo) suffix from historico
+                    st.session_state.historico["Projetista"] = st.session_state.historico["Projetista"].apply(lambda x: x.replace(f"{sel_re} (Inativo)", sel_re) if isinstance(x,str) else x)
+                    save_projetistas(st.session_state.projetistas); save_inativos(st.session_state.inativos); save_historico(st.session_state.historico)
+                    registrar_log(cu["usuario"], role, "REATIVAR_PROJETISTA", f"{sel_re} reativado na sala {sala_re} com {pontos_restore} pontos")
+                    concluir(f"Projetista {sel_re} reativado e pontuação restaurada ({pontos_restore}).")
+
+def tabelas_ranking():
+    df_act = st.session_state.projetistas[st.session_state.projetistas["Projetista"]!="-"]
+    # Show class S first (as requested)
+    por_classe = {}
+    for cls in ["S","A","B","C","D"]:
+        sub = df_act[(df_act["Classe"]==cls) & (df_act["Status"]=="Ativo")].sort_values("Pontuação", ascending=False)
+        if not sub.empty:
+            por_classe[cls] = sub[["Projetista","Equipe","Sala","Pontuação"]].reset_index(drop=True)
+    geral = df_act[df_act["Status"]=="Ativo"].sort_values("Pontuação", ascending=False).reset_index(drop=True)
+    if not geral.empty:
+        geral["RankingGeral"] = geral.index+1
+        geral["RankingGeral"] = geral.apply(lambda x: x["RankingGeral"] if x["Pontuação"]>0 else "-", axis=1)
+        geral = geral[["RankingGeral","Projetista","Equipe","Classe","Sala","Pontuação"]]
+    return por_classe, geral
+
+def admin_rankings():
+    st.subheader("Rankings")
+    calcular_rankings()
+    por_classe, geral = memo("rankings", ("projetistas",), tabelas_ranking)
+    for cls, sub in por_classe.items():
+        st.write(f"### Classe {cls}")
+        st.dataframe(sub, use_container_width=True)
+    st.write("### Ranking Geral")
+    if not geral.empty:
+        st.dataframe(geral, use_container_width=True)
+
+# ========= COORDENADOR =========
+@fragmento
+def coord_sala(cu, role, sala_num):
+    subset = memo(f"sala_{sala_num}", ("projetistas",), lambda: st.session_state.projetistas[st.session_state.projetistas["Sala"]==sala_num][["Projetista","Classe","Pontuação","Status"]])
+    st.dataframe(subset, use_container_width=True)
+    # add projectistas in your room
+    with st.expander("➕ Adicionar Projetista à minha sala"):
+        nome_new = st.text_input("Nome do projetista", key="coord_add_name")
+        classe_new = st.selectbox("Classe", options=CLASSES, key="coord_add_classe")
+        if st.button("Adicionar à minha sala"):
+            vagas = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==sala_num) & (st.session_state.projetistas["Projetista"]=="-")]
+            if vagas.empty:
+                st.error("Sala cheia.")
+            else:
                 salvar_snapshot()
-                name = sel_proj
-                hist_proj = st.session_state.historico[st.session_state.historico["Projetista"]==name]
-                csvb = hist_proj.to_csv(index=False).encode("utf-8")
-                fn = f"historico_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                st.download_button("⬇️ Baixar relatório do projetista", data=csvb, file_name=fn, mime="text/csv")
-                # save pontos to inativos
-                proj_idx = st.session_state.projetistas[st.session_state.projetistas["Projetista"]==name].index[0]
-                pontos = int(st.session_state.projetistas.at[proj_idx,"Pontuação"])
-                in_df = st.session_state.inativos
-                in_df = pd.concat([in_df, pd.DataFrame([{"Projetista":name,"Pontuacao":pontos,"RemovidoEm":datetime.now().isoformat()}])], ignore_index=True)
-                st.session_state.inativos = in_df
-                save_inativos(in_df)
-                # mark history entries as Inativo
-                mask = st.session_state.historico["Projetista"]==name
-                st.session_state.historico.loc[mask,"Projetista"] = st.session_state.historico.loc[mask,"Projetista"].apply(lambda x: f"{x} (Inativo)")
-                # remove from quadro (libera vaga) but keep status as '-' in that row
-                st.session_state.projetistas.loc[proj_idx,["Projetista","Classe","Pontuação","Status"]] = ["-","-",0,"Livre"]
+                idx = vagas.index[0]
+                st.session_state.projetistas.loc[idx,["Projetista","Classe","Pontuação","Status"]] = [nome_new.strip(), classe_new, 0, "Ativo"]
                 save_projetistas(st.session_state.projetistas)
-                save_historico(st.session_state.historico)
-                registrar_log(cu["usuario"], role, "INATIVAR_PROJETISTA", f"{name} inativado (pontos salvos: {pontos})")
-                st.success("Projetista inativado e relatório gerado.")
-        with cC:
-            in_candidates = st.session_state.inativos["Projetista"].tolist() if not st.session_state.inativos.empty else []
-            sel_re = st.selectbox("Projetista inativo", options=in_candidates if in_candidates else ["(nenhum)"], key="react_sel")
-            sala_re = st.selectbox("Sala para reativar", options=st.session_state.rooms["Sala"].tolist(), key="react_sala")
-            classe_re = st.selectbox("Classe ao reativar", options=CLASSES, key="react_classe")
-            if st.button("Reativar projetista"):
-                if sel_re == "(nenhum)":
-                    st.info("Nenhum inativo disponível.")
+                registrar_log(cu["usuario"], role, "ADICIONAR_PROJETISTA_SALA", f"{nome_new} -> sala {sala_num}")
+                concluir("Projetista adicionado à sua sala.")
+
+# create/validate demand
+@fragmento
+def coord_demanda(cu, role, sala_num):
+    with st.expander("📋 Criar Demanda e Validar Pontos"):
+        dem_name = st.text_input("Nome da demanda", key="coord_dem_name")
+        param = st.selectbox("Parâmetro", options=list(CRITERIOS.keys()), key="coord_param")
+        crit_ops = [f"{n} - {f} -> {r}" for (n,f,r) in CRITERIOS[param]]
+        crit = st.selectbox("Critério", options=crit_ops, key="coord_crit")
+        proj_options = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==sala_num) & (st.session_state.projetistas["Projetista"]!="-")]["Projetista"].tolist()
+        proj_sel = st.selectbox("Selecionar projetista", options=proj_options if proj_options else ["(nenhum)"], key="coord_proj")
+        if st.button("Validar e aplicar ponto"):
+            if not dem_name.strip() or proj_sel=="(nenhum)":
+                st.error("Preencha a demanda e selecione projetista.")
+            else:
+                try:
+                    nota = int(crit.split(" - ")[0])
+                    resumo = crit.split("->")[-1].strip()
+                except:
+                    nota=None; resumo=""
+                salvar_snapshot()
+                pts = pontos_por_nota(nota)
+                if pts>0:
+                    st.session_state.projetistas.loc[st.session_state.projetistas["Projetista"]==proj_sel,"Pontuação"] += pts
+                nova = {"Timestamp":pd.Timestamp.now(),"Disciplina":st.session_state.rooms[st.session_state.rooms["Sala"]==sala_num]["Equipe"].iat[0],"Demanda":dem_name.strip(),"Projetista":proj_sel,"Parâmetro":param,"Nota":nota,"Resumo":resumo,"PontosAtribuídos":pts}
+                st.session_state.historico = pd.concat([novas_linhas("historico", [nova]), st.session_state.historico], ignore_index=True)
+                save_projetistas(st.session_state.projetistas); save_historico(st.session_state.historico)
+                registrar_log(cu["usuario"], role, "VALIDAR_PONTO", f"{proj_sel} +{pts} ({param}) - {dem_name.strip()}")
+                concluir("Demanda validada e histórico atualizado.")
+
+# Consolidate evaluations for coordinator
+@fragmento
+def coord_consolidacao(cu, role, sala_num):
+    with st.expander("⭐ Consolidação: Avaliações dos Projetistas ao Coordenador"):
+        st.write("Projetistas avaliam o coordenador (anônimo). Aqui você consolida e aplica pontos ao seu usuário (coordenador).")
+        # find evaluations for this coordinator in historico (Demanda starting with 'AVALIACAO_COORDENADOR:<coord_user>')
+        coord_evals = memo(f"evals_{cu['usuario']}", ("historico",), lambda: st.session_state.historico[st.session_state.historico["Demanda"].str.startswith(f"AVALIACAO_COORDENADOR:{cu['usuario']}", na=False)])
+        if coord_evals.empty:
+            st.info("Nenhuma avaliação registrada para você.")
+        else:
+            st.dataframe(coord_evals, use_container_width=True)
+            if st.button("Consolidar e aplicar pontos"):
+                salvar_snapshot()
+                # compute mean per parameter across projetistas from this sala
+                sala_proj = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==sala_num) & (st.session_state.projetistas["Status"]=="Ativo")]["Projetista"].tolist()
+                # filter evaluations where Projetista in sala_proj
+                rel = coord_evals[coord_evals["Projetista"].isin(sala_proj)]
+                if rel.empty:
+                    st.warning("Avaliações recebidas não provêm de projetistas desta sala (nenhuma aplicável).")
                 else:
-                    vagas = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==int(sala_re)) & (st.session_state.projetistas["Projetista"]=="-")]
-                    if vagas.empty:
-                        st.error("Sala sem vaga livre.")
-                    else:
-                        salvar_snapshot()
-                        idx = vagas.index[0]
-                        # restore pontos from inativos
-                        row = st.session_state.inativos[st.session_state.inativos["Projetista"]==sel_re].iloc[0]
-                        pontos_restore = int(row["Pontuacao"]) if pd.notna(row["Pontuacao"]) else 0
-                        st.session_state.projetistas.loc[idx, ["Projetista","Classe","Pontuação","Status"]] = [sel_re, classe_re, pontos_restore, "Ativo"]
-                        # remove from inativos
-                        st.session_state.inativos = st.session_state.inativos[st.session_state.inativos["Projetista"]!=sel_re].reset_index(drop=True)
-                        # remove (Inativo) suffix from historico
-                        st.session_state.historico["Projetista"] = st.session_state.historico["Projetista"].apply(lambda x: x.replace(f"{sel_re} (Inativo)", sel_re) if isinstance(x,str) else x)
-                        save_projetistas(st.session_state.projetistas); save_inativos(st.session_state.inativos); save_historico(st.session_state.historico)
-                        registrar_log(cu["usuario"], role, "REATIVAR_PROJETISTA", f"{sel_re} reativado na sala {sala_re} com {pontos_restore} pontos")
-                        st.success(f"Projetista {sel_re} reativado e pontuação restaurada ({pontos_restore}).")
-
-        # Rankings for admin
+                    total_aplicado = 0.0
+                    for param, g in rel.groupby("Parâmetro"):
+                        avg = g["Nota"].mean()
+                        pts = 0.0
+                        if avg >= 9: pts = 1.0
+                        elif avg >= 8: pts = 0.5
+                        else: pts = 0.0
+                        # record in historico as application to coordinator (Demanda/entry)
+                        nova = {"Timestamp":pd.Timestamp.now(),"Disciplina":st.session_state.rooms[st.session_state.rooms["Sala"]==sala_num]["Equipe"].iat[0],"Demanda":f"COORD_APLICACAO:{param}","Projetista":cu["usuario"],"Parâmetro":param,"Nota":round(avg,2),"Resumo":"Consolidação avaliações projetistas","PontosAtribuídos":pts}
+                        st.session_state.historico = pd.concat([novas_linhas("historico", [nova]), st.session_state.historico], ignore_index=True)
+                        total_aplicado += pts
+                    save_historico(st.session_state.historico)
+                    registrar_log(cu["usuario"], role, "CONSOLIDAR_AVALS_COORD", f"Aplicado {total_aplicado} pontos (sala {sala_num})")
+                    concluir(f"Avaliações consolidadas — total de pontos aplicados: {total_aplicado}")
+
+# ========= PROJETISTA =========
+# create own demand
+@fragmento
+def proj_demanda(cu, role, ent):
+    nome = cu["nome"]
+    with st.expander("➕ Criar Demanda (minha)"):
+        dname = st.text_input("Nome da demanda", key="proj_dem_name")
+        param = st.selectbox("Parâmetro", options=list(CRITERIOS.keys()), key="proj_param")
+        crits = [f"{n} - {f} -> {r}" for (n,f,r) in CRITERIOS[param]]
+        crit_choice = st.selectbox("Critério", options=crits, key="proj_crit")
+        if st.button("Registrar demanda (minha)"):
+            if not dname.strip():
+                st.warning("Informe nome da demanda.")
+            else:
+                try:
+                    nota = int(crit_choice.split(" - ")[0])
+                    resumo = crit_choice.split("->")[-1].strip()
+                except:
+                    nota=None; resumo=""
+                salvar_snapshot()
+                pts = pontos_por_nota(nota)
+                sala_num = int(ent["Sala"])
+                disciplina = st.session_state.rooms[st.session_state.rooms["Sala"]==sala_num]["Equipe"].iat[0]
+                nova = {"Timestamp":pd.Timestamp.now(),"Disciplina":disciplina,"Demanda":dname.strip(),"Projetista":nome,"Parâmetro":param,"Nota":nota,"Resumo":resumo,"PontosAtribuídos":pts}
+                st.session_state.historico = pd.concat([novas_linhas("historico", [nova]), st.session_state.historico], ignore_index=True)
+                if pts>0:
+                    st.session_state.projetistas.loc[st.session_state.projetistas["Projetista"]==nome,"Pontuação"] += pts
+                    save_projetistas(st.session_state.projetistas)
+                save_historico(st.session_state.historico)
+                registrar_log(cu["usuario"], role, "CRIAR_DEMANDA_PROPRIA", f"{dname.strip()} criado por {nome}")
+                concluir("Demanda criada e ponto aplicado (se aplicável).")
+
+# evaluate coordinator
+@fragmento
+def proj_avaliar(cu, role, ent):
+    nome = cu["nome"]
+    with st.expander("⭐ Avaliar meu Coordenador (anônimo)"):
+        sala_num = int(ent["Sala"])
+        coord_row = st.session_state.users[st.session_state.users["sala_atribuida"]==sala_num]
+        if coord_row.empty:
+            st.info("Nenhum coordenador atribuído a esta sala.")
+        else:
+            coord_user = coord_row.iloc[0]["usuario"]
+            coord_name = coord_row.iloc[0]["nome"]
+            st.write(f"Avaliar Coordenador: **{coord_name}** (sala {sala_num})")
+            param_eval = st.selectbox("Parâmetro", options=list(CRITERIOS.keys()), key="aval_param")
+            crits_eval = [f"{n} - {f} -> {r}" for (n,f,r) in CRITERIOS[param_eval]]
+            crit_eval = st.selectbox("Critério", options=crits_eval, key="aval_crit")
+            if st.button("Enviar avaliação"):
+                try:
+                    nota = int(crit_eval.split(" - ")[0])
+                    resumo = crit_eval.split("->")[-1].strip()
+                except:
+                    nota=None; resumo=""
+                salvar_snapshot()
+                nova = {"Timestamp":pd.Timestamp.now(),"Disciplina":ent["Equipe"],"Demanda":f"AVALIACAO_COORDENADOR:{coord_user}","Projetista":nome,"Parâmetro":param_eval,"Nota":nota,"Resumo":resumo,"PontosAtribuídos":None}
+                st.session_state.historico = pd.concat([novas_linhas("historico", [nova]), st.session_state.historico], ignore_index=True)
+                save_historico(st.session_state.historico)
+                registrar_log(cu["usuario"], role, "AVALIAR_COORDENADOR", f"{nome} avaliou {coord_user} ({param_eval}={nota})")
+                concluir("Avaliação enviada (anônima).")
+
+if st.session_state.current_user:
+    aplicar_tema_usuario()
+    cu = st.session_state.current_user
+    st.header(f"Olá, {cu['nome']} — {cu['role']}")
+    st.markdown(f"**Usuário:** `{cu['usuario']}`  •  **Sala atribuída:** `{cu.get('sala_atribuida') or '(nenhuma)'}`")
+
+    role = cu["role"]
+
+    st.markdown("---")
+    acoes_comuns(cu, role)
+    st.markdown("---")
+
+    # ========= DIRETOR / GERENTE VIEW =========
+    if role in ["Diretor","Gerente"]:
+        st.subheader("Administração Geral")
+        admin_salas(cu, role)
+        admin_perfis(cu, role)
+        st.markdown("---")
+        admin_quadro(cu, role)
         st.markdown("---")
-        st.subheader("Rankings")
-        calcular_rankings()
-        df_act = st.session_state.projetistas[st.session_state.projetistas["Projetista"]!="-"]
-        # Show class S first (as requested)
-        for cls in ["S","A","B","C","D"]:
-            sub = df_act[(df_act["Classe"]==cls) & (df_act["Status"]=="Ativo")].sort_values("Pontuação", ascending=False)
-            if not sub.empty:
-                st.write(f"### Classe {cls}")
-                st.dataframe(sub[["Projetista","Equipe","Sala","Pontuação"]].reset_index(drop=True), use_container_width=True)
-        st.write("### Ranking Geral")
-        geral = df_act[df_act["Status"]=="Ativo"].sort_values("Pontuação", ascending=False).reset_index(drop=True)
-        if not geral.empty:
-            geral["RankingGeral"] = geral.index+1
-            geral["RankingGeral"] = geral.apply(lambda x: x["RankingGeral"] if x["Pontuação"]>0 else "-", axis=1)
-            st.dataframe(geral[["RankingGeral","Projetista","Equipe","Classe","Sala","Pontuação"]], use_container_width=True)
+        admin_rankings()
 
     # ========= COORDENADOR VIEW =========
     elif role == "Coordenador":
         st.subheader("Painel do Coordenador (sua sala)")
         # get assigned sala for this user
         urow = st.session_state.users[st.session_state.users["usuario"]==cu["usuario"]]
-        sala_atr = urow["sala_atribuida"].values[0] if not urow.empty else ""
-        if sala_atr=="" or (pd.isna(sala_atr) if isinstance(sala_atr,float) else False):
+        sala_atr = urow["sala_atribuida"].iloc[0] if not urow.empty else pd.NA
+        if pd.isna(sala_atr):
             st.warning("Nenhuma sala atribuída. Peça a um Diretor/Gerente para atribuir sua sala.")
         else:
             sala_num = int(sala_atr)
             st.info(f"Sala atribuída: {sala_num}")
-            subset = st.session_state.projetistas[st.session_state.projetistas["Sala"]==sala_num]
-            st.dataframe(subset[["Projetista","Classe","Pontuação","Status"]], use_container_width=True)
-            # add projectistas in your room
-            with st.expander("➕ Adicionar Projetista à minha sala"):
-                nome_new = st.text_input("Nome do projetista", key="coord_add_name")
-                classe_new = st.selectbox("Classe", options=CLASSES, key="coord_add_classe")
-                if st.button("Adicionar à minha sala"):
-                    vagas = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==sala_num) & (st.session_state.projetistas["Projetista"]=="-")]
-                    if vagas.empty:
-                        st.error("Sala cheia.")
-                    else:
-                        salvar_snapshot()
-                        idx = vagas.index[0]
-                        st.session_state.projetistas.loc[idx,["Projetista","Classe","Pontuação","Status"]] = [nome_new.strip(), classe_new, 0, "Ativo"]
-                        save_projetistas(st.session_state.projetistas)
-                        registrar_log(cu["usuario"], role, "ADICIONAR_PROJETISTA_SALA", f"{nome_new} -> sala {sala_num}")
-                        st.success("Projetista adicionado à sua sala.")
-            # create/validate demand
-            with st.expander("📋 Criar Demanda e Validar Pontos"):
-                dem_name = st.text_input("Nome da demanda", key="coord_dem_name")
-                param = st.selectbox("Parâmetro", options=list(CRITERIOS.keys()), key="coord_param")
-                crit_ops = [f"{n} - {f} -> {r}" for (n,f,r) in CRITERIOS[param]]
-                crit = st.selectbox("Critério", options=crit_ops, key="coord_crit")
-                proj_options = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==sala_num) & (st.session_state.projetistas["Projetista"]!="-")]["Projetista"].tolist()
-                proj_sel = st.selectbox("Selecionar projetista", options=proj_options if proj_options else ["(nenhum)"], key="coord_proj")
-                if st.button("Validar e aplicar ponto"):
-                    if not dem_name.strip() or proj_sel=="(nenhum)":
-                        st.error("Preencha a demanda e selecione projetista.")
-                    else:
-                        try:
-                            nota = int(crit.split(" - ")[0])
-                            resumo = crit.split("->")[-1].strip()
-                        except:
-                            nota=None; resumo=""
-                        salvar_snapshot()
-                        pts = pontos_por_nota(nota)
-                        if pts>0:
-                            st.session_state.projetistas.loc[st.session_state.projetistas["Projetista"]==proj_sel,"Pontuação"] += pts
-                        nova = {"Timestamp":pd.Timestamp.now(),"Disciplina":st.session_state.rooms[st.session_state.rooms["Sala"]==sala_num]["Equipe"].iat[0],"Demanda":dem_name.strip(),"Projetista":proj_sel,"Parâmetro":param,"Nota":nota,"Resumo":resumo,"PontosAtribuídos":pts}
-                        st.session_state.historico = pd.concat([pd.DataFrame([nova]), st.session_state.historico], ignore_index=True)
-                        save_projetistas(st.session_state.projetistas); save_historico(st.session_state.historico)
-                        registrar_log(cu["usuario"], role, "VALIDAR_PONTO", f"{proj_sel} +{pts} ({param}) - {dem_name.strip()}")
-                        st.success("Demanda validada e histórico atualizado.")
-            # Consolidate evaluations for coordinator
-            with st.expander("⭐ Consolidação: Avaliações dos Projetistas ao Coordenador"):
-                st.write("Projetistas avaliam o coordenador (anônimo). Aqui você consolida e aplica pontos ao seu usuário (coordenador).")
-                # find evaluations for this coordinator in historico (Demanda starting with 'AVALIACAO_COORDENADOR:<coord_user>')
-                coord_evals = st.session_state.historico[st.session_state.historico["Demanda"].str.startswith(f"AVALIACAO_COORDENADOR:{cu['usuario']}", na=False)]
-                if coord_evals.empty:
-                    st.info("Nenhuma avaliação registrada para você.")
-                else:
-                    st.dataframe(coord_evals, use_container_width=True)
-                    if st.button("Consolidar e aplicar pontos"):
-                        salvar_snapshot()
-                        # compute mean per parameter across projetistas from this sala
-                        sala_proj = st.session_state.projetistas[(st.session_state.projetistas["Sala"]==sala_num) & (st.session_state.projetistas["Status"]=="Ativo")]["Projetista"].tolist()
-                        # filter evaluations where Projetista in sala_proj
-                        rel = coord_evals[coord_evals["Projetista"].isin(sala_proj)]
-                        if rel.empty:
-                            st.warning("Avaliações recebidas não provêm de projetistas desta sala (nenhuma aplicável).")
-                        else:
-                            total_aplicado = 0.0
-                            for param, g in rel.groupby("Parâmetro"):
-                                avg = g["Nota"].mean()
-                                pts = 0.0
-                                if avg >= 9: pts = 1.0
-                                elif avg >= 8: pts = 0.5
-                                else: pts = 0.0
-                                # record in historico as application to coordinator (Demanda/entry)
-                                nova = {"Timestamp":pd.Timestamp.now(),"Disciplina":st.session_state.rooms[st.session_state.rooms["Sala"]==sala_num]["Equipe"].iat[0],"Demanda":f"COORD_APLICACAO:{param}","Projetista":cu["usuario"],"Parâmetro":param,"Nota":round(avg,2),"Resumo":"Consolidação avaliações projetistas","PontosAtribuídos":pts}
-                                st.session_state.historico = pd.concat([pd.DataFrame([nova]), st.session_state.historico], ignore_index=True)
-                                total_aplicado += pts
-                            save_historico(st.session_state.historico)
-                            registrar_log(cu["usuario"], role, "CONSOLIDAR_AVALS_COORD", f"Aplicado {total_aplicado} pontos (sala {sala_num})")
-                            st.success(f"Avaliações consolidadas — total de pontos aplicados: {total_aplicado}")
+            coord_sala(cu, role, sala_num)
+            coord_demanda(cu, role, sala_num)
+            coord_consolidacao(cu, role, sala_num)
 
     # ========= PROJETISTA VIEW =========
     elif role == "Projetista":
@@ -683,60 +1156,10 @@ if st.session_state.current_user:
         else:
             ent = quadro.iloc[0]
             st.markdown(f"**Sala:** {ent['Sala']} • **Equipe:** {ent['Equipe']} • **Classe:** {ent['Classe']} • **Pontos:** {ent['Pontuação']}")
-            myhist = st.session_state.historico[st.session_state.historico["Projetista"]==nome].sort_values("Timestamp", ascending=False).reset_index(drop=True)
+            myhist = memo(f"hist_{nome}", ("historico",), lambda: st.session_state.historico[st.session_state.historico["Projetista"]==nome].sort_values("Timestamp", ascending=False).reset_index(drop=True))
             st.dataframe(myhist, use_container_width=True)
-            # create own demand
-            with st.expander("➕ Criar Demanda (minha)"):
-                dname = st.text_input("Nome da demanda", key="proj_dem_name")
-                param = st.selectbox("Parâmetro", options=list(CRITERIOS.keys()), key="proj_param")
-                crits = [f"{n} - {f} -> {r}" for (n,f,r) in CRITERIOS[param]]
-                crit_choice = st.selectbox("Critério", options=crits, key="proj_crit")
-                if st.button("Registrar demanda (minha)"):
-                    if not dname.strip():
-                        st.warning("Informe nome da demanda.")
-                    else:
-                        try:
-                            nota = int(crit_choice.split(" - ")[0])
-                            resumo = crit_choice.split("->")[-1].strip()
-                        except:
-                            nota=None; resumo=""
-                        salvar_snapshot()
-                        pts = pontos_por_nota(nota)
-                        sala_num = int(ent["Sala"])
-                        disciplina = st.session_state.rooms[st.session_state.rooms["Sala"]==sala_num]["Equipe"].iat[0]
-                        nova = {"Timestamp":pd.Timestamp.now(),"Disciplina":disciplina,"Demanda":dname.strip(),"Projetista":nome,"Parâmetro":param,"Nota":nota,"Resumo":resumo,"PontosAtribuídos":pts}
-                        st.session_state.historico = pd.concat([pd.DataFrame([nova]), st.session_state.historico], ignore_index=True)
-                        if pts>0:
-                            st.session_state.projetistas.loc[st.session_state.projetistas["Projetista"]==nome,"Pontuação"] += pts
-                            save_projetistas(st.session_state.projetistas)
-                        save_historico(st.session_state.historico)
-                        registrar_log(cu["usuario"], role, "CRIAR_DEMANDA_PROPRIA", f"{dname.strip()} criado por {nome}")
-                        st.success("Demanda criada e ponto aplicado (se aplicável).")
-            # evaluate coordinator
-            with st.expander("⭐ Avaliar meu Coordenador (anônimo)"):
-                sala_num = int(ent["Sala"])
-                coord_row = st.session_state.users[st.session_state.users["sala_atribuida"]==sala_num]
-                if coord_row.empty:
-                    st.info("Nenhum coordenador atribuído a esta sala.")
-                else:
-                    coord_user = coord_row.iloc[0]["usuario"]
-                    coord_name = coord_row.iloc[0]["nome"]
-                    st.write(f"Avaliar Coordenador: **{coord_name}** (sala {sala_num})")
-                    param_eval = st.selectbox("Parâmetro", options=list(CRITERIOS.keys()), key="aval_param")
-                    crits_eval = [f"{n} - {f} -> {r}" for (n,f,r) in CRITERIOS[param_eval]]
-                    crit_eval = st.selectbox("Critério", options=crits_eval, key="aval_crit")
-                    if st.button("Enviar avaliação"):
-                        try:
-                            nota = int(crit_eval.split(" - ")[0])
-                            resumo = crit_eval.split("->")[-1].strip()
-                        except:
-                            nota=None; resumo=""
-                        salvar_snapshot()
-                        nova = {"Timestamp":pd.Timestamp.now(),"Disciplina":ent["Equipe"],"Demanda":f"AVALIACAO_COORDENADOR:{coord_user}","Projetista":nome,"Parâmetro":param_eval,"Nota":nota,"Resumo":resumo,"PontosAtribuídos":None}
-                        st.session_state.historico = pd.concat([pd.DataFrame([nova]), st.session_state.historico], ignore_index=True)
-                        save_historico(st.session_state.historico)
-                        registrar_log(cu["usuario"], role, "AVALIAR_COORDENADOR", f"{nome} avaliou {coord_user} ({param_eval}={nota})")
-                        st.success("Avaliação enviada (anônima).")
+            proj_demanda(cu, role, ent)
+            proj_avaliar(cu, role, ent)
 
     # else other roles (rare)
     else:
@@ -747,15 +1170,10 @@ if st.session_state.current_user:
     if role in ["Diretor","Gerente","Coordenador"]:
         st.subheader("📜 Log de Gestão")
         ensure_log()
-        log_df = pd.read_csv(LOG_CSV, parse_dates=["timestamp"])
+        log_df = carregar_tabela(caminho(LOG_CSV), "log")
         st.dataframe(log_df.head(300), use_container_width=True)
 else:
     st.info("Faça login para usar o painel (barra lateral).")
 
-# Persist todas alterações antes de finalizar
-save_users(st.session_state.users)
-save_rooms(st.session_state.rooms)
-save_projetistas(st.session_state.projetistas)
-save_historico(st.session_state.historico)
-save_inativos(st.session_state.inativos)
+# Cada ação já grava as tabelas que altera (save_*); não regravar tudo a cada rerun
 ensure_log()
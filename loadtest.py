@@ -0,0 +1,228 @@
+# loadtest.py
+# Teste de carga do app.py: N sessões simuladas (Coordenador / Projetista / Diretor) sobre uma base sintética,
+# usando o AppTest do Streamlit (sem navegador). Mede latência de rerun, bytes gravados e memória por sessão.
+# Uso: python loadtest.py --sessoes 12 --salas 8 --historico 5000
+# Resultado: uma linha JSON por execução em loadtest_results.jsonl (para acompanhar tendência).
+
+import argparse, hashlib, json, os, resource, shutil, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+SALT = "painel_avaliacao_salt_v1"  # mesmo SALT de app.py
+DISCIPLINAS = ["Hidrossanitário","Elétrica"]
+CLASSES = ["S","A","B","C","D"]
+PAPEIS = ["Coordenador","Projetista","Diretor"]  # distribuídos em rodízio entre as sessões
+
+def hash_password(pw):
+    return hashlib.sha256((SALT + pw).encode("utf-8")).hexdigest()
+
+# ---------------- Base sintética ----------------
+def gerar_base(data_dir, salas, vagas, n_historico):
+    os.makedirs(data_dir, exist_ok=True)
+    agora = datetime.now()
+    rooms, proj, users, hist = [], [], [], []
+    users.append({"usuario":"diretor1","nome":"Diretor 1","role":"Diretor","senha_hash":hash_password("diretor1!"),"cor_tema":"","ativo":True,"criado_em":agora.isoformat(),"ultimo_login":"","sala_atribuida":""})
+    for sala in range(1, salas+1):
+        equipe = DISCIPLINAS[(sala-1) % len(DISCIPLINAS)]
+        rooms.append({"Sala":sala,"Equipe":equipe,"Vagas":vagas})
+        users.append({"usuario":f"coord{sala}","nome":f"Coordenador {sala}","role":"Coordenador","senha_hash":hash_password(f"coord{sala}!"),"cor_tema":"","ativo":True,"criado_em":agora.isoformat(),"ultimo_login":"","sala_atribuida":sala})
+        for v in range(vagas):
+            nome = f"Projetista {sala}-{v+1}"
+            proj.append({"Sala":sala,"Equipe":equipe,"Classe":CLASSES[v % len(CLASSES)],"Projetista":nome,"Pontuação":v,"Status":"Ativo","RankingClasse":"-"})
+            users.append({"usuario":f"proj{sala}_{v+1}","nome":nome,"role":"Projetista","senha_hash":hash_password(f"proj{sala}_{v+1}!"),"cor_tema":"","ativo":True,"criado_em":agora.isoformat(),"ultimo_login":"","sala_atribuida":""})
+    for i in range(n_historico):
+        p = proj[i % len(proj)]
+        nota = 10 - (i % 8)
+        hist.append({"Timestamp":(agora - timedelta(minutes=i)).isoformat(),"Disciplina":p["Equipe"],"Demanda":f"Demanda sintética {i}","Projetista":p["Projetista"],"Parâmetro":"Qualidade Técnica","Nota":nota,"Resumo":"Carga","PontosAtribuídos":max(nota-7,0)})
+    pd.DataFrame(users).to_csv(os.path.join(data_dir,"users.csv"),index=False)
+    pd.DataFrame(rooms).to_csv(os.path.join(data_dir,"salas.csv"),index=False)
+    pd.DataFrame(proj).to_csv(os.path.join(data_dir,"projetistas.csv"),index=False)
+    pd.DataFrame(hist, columns=["Timestamp","Disciplina","Demanda","Projetista","Parâmetro","Nota","Resumo","PontosAtribuídos"]).to_csv(os.path.join(data_dir,"historico_demandas.csv"),index=False)
+    pd.DataFrame(columns=["timestamp","usuario","role","acao","detalhes"]).to_csv(os.path.join(data_dir,"log_gestao.csv"),index=False)
+    pd.DataFrame(columns=["Projetista","Pontuacao","RemovidoEm"]).to_csv(os.path.join(data_dir,"inativos.csv"),index=False)
+
+def credenciais(papel, i, salas, vagas):
+    sala = i % salas + 1
+    if papel=="Coordenador":
+        return f"coord{sala}", f"coord{sala}!"
+    if papel=="Projetista":
+        v = i // salas % vagas + 1
+        return f"proj{sala}_{v}", f"proj{sala}_{v}!"
+    return "diretor1", "diretor1!"
+
+# ---------------- Jornadas ----------------
+def ver_rankings(at):
+    # lê as tabelas de ranking renderizadas no painel do Diretor (classes + Ranking Geral)
+    titulos = [m.value for m in at.markdown if m.value.startswith("### ")]
+    if "### Ranking Geral" not in titulos:
+        raise RuntimeError("Ranking Geral não renderizado")
+    tabelas = [df.value for df in at.dataframe]
+    if not any(len(t) and "RankingGeral" in t.columns for t in tabelas):
+        raise RuntimeError("tabela do Ranking Geral vazia")
+
+def clicar(at, label):
+    botoes = [b for b in at.button if b.label==label]
+    if not botoes:
+        raise RuntimeError(f"botão não encontrado: {label}")
+    botoes[0].click()
+
+def passos_jornada(papel, usuario, senha, i):
+    # cada passo prepara widgets e devolve; o rerun é medido por Sessao.executar
+    def login(at):
+        at.text_input(key="login_user").input(usuario)
+        at.text_input(key="login_pw").input(senha)
+        clicar(at, "Entrar")
+    def logout(at):
+        clicar(at, "Logout")
+    passos = [("abrir", None), ("login", login)]
+    if papel=="Coordenador":
+        def validar(at):
+            at.text_input(key="coord_dem_name").input(f"Carga {i}")
+            clicar(at, "Validar e aplicar ponto")
+        passos.append(("validar_ponto", validar))
+    elif papel=="Projetista":
+        def demanda(at):
+            at.text_input(key="proj_dem_name").input(f"Carga {i}")
+            clicar(at, "Registrar demanda (minha)")
+        def avaliar(at):
+            clicar(at, "Enviar avaliação")
+        passos += [("criar_demanda", demanda), ("avaliar_coordenador", avaliar)]
+    else:
+        passos.append(("ver_rankings", ver_rankings))
+    passos.append(("logout", logout))
+    return passos
+
+# ---------------- Medição ----------------
+def bytes_gravados(data_dir, antes):
+    # soma o tamanho dos arquivos cujo mtime mudou (o app regrava os CSVs inteiros)
+    total, depois = 0, {}
+    for raiz,_,arquivos in os.walk(data_dir):
+        for a in arquivos:
+            p = os.path.join(raiz,a)
+            info = os.stat(p)
+            depois[p] = info.st_mtime_ns
+            if antes.get(p) != info.st_mtime_ns:
+                total += info.st_size
+    return total, depois
+
+def _bytes_dataframes(v):
+    # _last é um dict de DataFrames; _memo guarda (chave, valor) com valor DataFrame ou tupla (dict, DataFrame)
+    if isinstance(v,pd.DataFrame):
+        return int(v.memory_usage(deep=True).sum())
+    if isinstance(v,dict):
+        return sum(_bytes_dataframes(x) for x in v.values())
+    if isinstance(v,(list,tuple)):
+        return sum(_bytes_dataframes(x) for x in v)
+    return 0
+
+def memoria_sessao(at):
+    return sum(_bytes_dataframes(at.session_state[k]) for k in ("users","rooms","projetistas","historico","inativos","_last","_memo") if k in at.session_state)
+
+class Sessao:
+    def __init__(self, i, papel, usuario, senha, timeout):
+        self.papel = papel
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.passos = passos_jornada(papel, usuario, senha, i)
+        self.memoria = 0
+
+    def executar(self, n, data_dir):
+        nome, acao = self.passos[n]
+        amostra = {"papel":self.papel, "passo":nome, "ms":None, "bytes":0, "erro":False}
+        try:
+            # falha num passo (widget ausente porque o rerun anterior quebrou, timeout...) vira erro da amostra
+            if acao is not None:
+                acao(self.at)
+            _, antes = bytes_gravados(data_dir, {})
+            t0 = time.perf_counter()
+            self.at.run()
+            amostra["ms"] = (time.perf_counter() - t0) * 1000
+            amostra["bytes"], _ = bytes_gravados(data_dir, antes)
+            self.memoria = max(self.memoria, memoria_sessao(self.at))
+            if self.at.exception:
+                amostra["erro"] = self.at.exception[0].message
+        except Exception as e:
+            amostra["erro"] = f"{type(e).__name__}: {e}"
+        return amostra
+
+def rodar_sessoes(specs, base, timeout):
+    # rodízio: todas as sessões avançam um passo por rodada, como usuários simultâneos
+    os.chdir(base)  # app.py usa DATA_DIR relativo ("data")
+    data_dir = os.path.join(base, "data")
+    sessoes = [Sessao(i, papel, usuario, senha, timeout) for i, papel, usuario, senha in specs]
+    amostras = []
+    for n in range(max((len(s.passos) for s in sessoes), default=0)):
+        amostras += [s.executar(n, data_dir) for s in sessoes if n < len(s.passos)]
+    return amostras, [s.memoria for s in sessoes]
+
+def percentis(valores):
+    if not valores:
+        return {}
+    v = sorted(valores)
+    pick = lambda q: v[min(len(v)-1, int(round(q * (len(v)-1))))]
+    return {"n":len(v), "p50":round(pick(0.50),2), "p90":round(pick(0.90),2), "p99":round(pick(0.99),2), "max":round(v[-1],2)}
+
+def main():
+    ap = argparse.ArgumentParser(description="Teste de carga do painel (AppTest)")
+    ap.add_argument("--sessoes", type=int, default=9)
+    ap.add_argument("--salas", type=int, default=8)
+    ap.add_argument("--vagas", type=int, default=6)
+    ap.add_argument("--historico", type=int, default=2000, help="linhas sintéticas em historico_demandas.csv")
+    ap.add_argument("--workers", type=int, default=1, help=">1 divide as sessões entre processos sobre a mesma base (o AppTest não roda em threads; bytes gravados ficam aproximados)")
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("--saida", default="loadtest_results.jsonl")
+    ap.add_argument("--manter-base", action="store_true", help="não apaga o diretório sintético ao final")
+    args = ap.parse_args()
+
+    saida = os.path.abspath(args.saida)
+    base = tempfile.mkdtemp(prefix="loadtest_")
+    data_dir = os.path.join(base, "data")
+    gerar_base(data_dir, args.salas, args.vagas, args.historico)
+    cwd = os.getcwd()
+    specs = []
+    for i in range(args.sessoes):
+        papel = PAPEIS[i % len(PAPEIS)]
+        usuario, senha = credenciais(papel, i // len(PAPEIS), args.salas, args.vagas)
+        specs.append((i, papel, usuario, senha))
+    workers = max(1, min(args.workers, args.sessoes))
+    try:
+        amostras, memorias = [], []
+        t0 = time.perf_counter()
+        if workers == 1:
+            amostras, memorias = rodar_sessoes(specs, base, args.timeout)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for a, m in pool.map(rodar_sessoes, [specs[w::workers] for w in range(workers)], [base]*workers, [args.timeout]*workers):
+                    amostras += a
+                    memorias += m
+        duracao = time.perf_counter() - t0
+    finally:
+        os.chdir(cwd)
+        if not args.manter_base:
+            shutil.rmtree(base, ignore_errors=True)
+
+    resultado = {
+        "timestamp":datetime.now().isoformat(),
+        "config":{k:getattr(args,k) for k in ("sessoes","salas","vagas","historico","workers")},
+        "duracao_s":round(duracao,3),
+        "reruns":len(amostras),
+        "erros":sum(bool(a["erro"]) for a in amostras),
+        "erros_por_passo":{p:[a["erro"] for a in amostras if a["passo"]==p and a["erro"]] for p in sorted({a["passo"] for a in amostras if a["erro"]})},
+        "latencia_ms":percentis([a["ms"] for a in amostras if a["ms"] is not None]),
+        "latencia_ms_por_passo":{p:percentis([a["ms"] for a in amostras if a["passo"]==p and a["ms"] is not None]) for p in sorted({a["passo"] for a in amostras})},
+        "bytes_gravados":sum(a["bytes"] for a in amostras),
+        "bytes_gravados_por_rerun":round(sum(a["bytes"] for a in amostras) / max(1,len(amostras))),
+        "memoria_sessao_bytes":percentis(memorias),
+        "rss_max_kb":max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss),
+    }
+    with open(saida,"a",encoding="utf-8") as f:
+        f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    if args.manter_base:
+        print(f"Base sintética mantida em {base}")
+
+if __name__ == "__main__":
+    main()
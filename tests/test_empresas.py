@@ -0,0 +1,94 @@
+# Empresas: ids aceitos, seletor da barra lateral e cache de tabelas compartilhado entre sessões.
+import ast
+import functools
+import os
+import threading
+import types
+from collections import OrderedDict
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+EMPRESAS = """empresa,nome,disciplinas,senha_inicial
+acme,Acme,Elétrica,acme-2024
+../fora,Fora,Elétrica,x
+Maiuscula,Maiúscula,Elétrica,x
+semsenha,Sem senha,Elétrica,
+"""
+FUNCOES_CACHE = ("_cache_empresas","_carimbo","_cache_get","_cache_put","_cache_invalidar","carregar_tabela","_gravar_csv")
+
+def _seletor(at):
+    return next(s for s in at.selectbox if s.label=="Empresa")
+
+def _rodar_com_empresas(tmp_path, monkeypatch, conteudo):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "empresas.csv").write_text(conteudo, encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    assert not at.exception
+    return at
+
+def test_seletor_so_oferece_empresas_validas(tmp_path, monkeypatch):
+    at = _rodar_com_empresas(tmp_path, monkeypatch, EMPRESAS)
+    assert _seletor(at).options == ["Padrão", "Acme"]
+    assert not (tmp_path / "data" / "empresas" / "semsenha").exists()
+    assert not (tmp_path / "data" / "fora").exists()
+
+def test_empresa_removida_volta_para_padrao(tmp_path, monkeypatch):
+    at = _rodar_com_empresas(tmp_path, monkeypatch, EMPRESAS)
+    _seletor(at).set_value("acme").run()
+    assert at.session_state["empresa"] == "acme"
+    (tmp_path / "data" / "empresas.csv").write_text(EMPRESAS.replace("acme,Acme,Elétrica,acme-2024\n", ""), encoding="utf-8")
+    at.run()
+    assert not at.exception
+    assert at.session_state["empresa"] == "padrao"
+
+def _modulo_cache(ler_csv):
+    # só as funções do cache, sem rodar o script Streamlit
+    arvore = ast.parse(open(APP_PATH, encoding="utf-8").read())
+    nos = [n for n in arvore.body if isinstance(n, ast.FunctionDef) and n.name in FUNCOES_CACHE]
+    nos += [n for n in arvore.body if isinstance(n, ast.Assign) and any(getattr(t, "id", None)=="MAX_EMPRESAS_EM_CACHE" for t in n.targets)]
+    st = types.SimpleNamespace(cache_resource=functools.cache)
+    ns = {"os":os, "threading":threading, "OrderedDict":OrderedDict, "st":st, "_ler_csv":ler_csv}
+    exec(compile(ast.Module(body=nos, type_ignores=[]), APP_PATH, "exec"), ns)
+    return ns
+
+def _ler(path, tabela):
+    return pd.read_csv(path), False
+
+def _gravar(path, valor):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame({"v":[valor]}).to_csv(path, index=False)
+
+def test_cache_descarta_empresa_ociosa_ha_mais_tempo(tmp_path):
+    app = _modulo_cache(_ler)
+    limite = app["MAX_EMPRESAS_EM_CACHE"]
+    paths = [str(tmp_path / f"e{i}" / "users.csv") for i in range(limite + 1)]
+    for i, p in enumerate(paths):
+        _gravar(p, i)
+    for p in paths[:limite]:
+        app["carregar_tabela"](p, "users")
+    app["carregar_tabela"](paths[0], "users")  # e0 volta a ser a mais recente
+    app["carregar_tabela"](paths[limite], "users")
+    em_cache = list(app["_cache_empresas"]()["dados"])
+    assert len(em_cache) == limite
+    assert os.path.dirname(paths[1]) not in em_cache
+    assert os.path.dirname(paths[0]) in em_cache
+
+def test_cache_ignora_leitura_concorrente_com_gravacao(tmp_path):
+    path = str(tmp_path / "e" / "users.csv")
+    _gravar(path, "antigo")
+
+    def ler_durante_gravacao(p, tabela):
+        df = pd.read_csv(p)
+        _gravar(p, "novo valor")  # outra sessão salva enquanto esta ainda está lendo
+        return df, False
+
+    app = _modulo_cache(ler_durante_gravacao)
+    assert app["carregar_tabela"](path, "users")["v"].tolist() == ["antigo"]
+    app["_ler_csv"] = _ler
+    assert app["carregar_tabela"](path, "users")["v"].tolist() == ["novo valor"]
+    assert app["_cache_get"](path)["v"].tolist() == ["novo valor"]
@@ -0,0 +1,72 @@
+# Arquivo frio do histórico: importar backup e desfazer devolvem o arquivo anterior.
+import io
+import os
+import zipfile
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+CABECALHO = "Timestamp,Disciplina,Demanda,Projetista,Parâmetro,Nota,Resumo,PontosAtribuídos\n"
+
+def _hist(*linhas):
+    return CABECALHO + "".join(f"{ts},Elétrica,{dem},Ana,Proatividade,9,Ok,2\n" for ts, dem in linhas)
+
+def _demandas_arquivadas(data):
+    d = data / "historico_arquivo"
+    return sorted(pd.concat([pd.read_parquet(p) if p.suffix==".parquet" else pd.read_csv(p) for p in d.iterdir()])["Demanda"])
+
+def _clicar(at, label):
+    next(b for b in at.button if b.label==label).click()
+    at.run()
+    assert not at.exception
+
+def _substituidos(data):
+    return sorted(p.name for p in data.iterdir() if p.name.startswith("historico_arquivo_substituido_"))
+
+def _entrar_como_diretor(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "historico_demandas.csv").write_text(_hist(("2020-01-10 10:00:00", "antiga"), (pd.Timestamp.now(), "recente")), encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    assert _demandas_arquivadas(data) == ["antiga"]
+    at.text_input(key="login_user").input("diretor1")
+    at.text_input(key="login_pw").input("diretor1!")
+    _clicar(at, "Entrar")
+    return at, data
+
+def _importar(at, data, nome_zip, antiga, recente):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for nome in ("users.csv", "projetistas.csv", "salas.csv"):
+            zf.write(data / nome, nome)
+        zf.writestr("historico_demandas.csv", _hist(("2019-05-01 08:00:00", antiga), (pd.Timestamp.now(), recente)))
+    at.file_uploader[0].set_value((nome_zip, buf.getvalue(), "application/zip"))
+    at.run()
+    assert not at.exception
+
+def test_desfazer_import_restaura_arquivo(tmp_path, monkeypatch):
+    at, data = _entrar_como_diretor(tmp_path, monkeypatch)
+    _importar(at, data, "backup.zip", "do backup", "recente backup")
+    assert _demandas_arquivadas(data) == ["do backup"]
+    assert list(at.session_state["historico"]["Demanda"]) == ["recente backup"]
+    assert len(_substituidos(data)) == 1
+
+    _clicar(at, "↩️ Desfazer última ação")
+    assert _demandas_arquivadas(data) == ["antiga"]
+    assert list(at.session_state["historico"]["Demanda"]) == ["recente"]
+    assert _substituidos(data) == []
+
+def test_arquivo_substituido_sai_com_o_snapshot(tmp_path, monkeypatch):
+    at, data = _entrar_como_diretor(tmp_path, monkeypatch)
+    _importar(at, data, "backup1.zip", "backup 1", "recente 1")
+    _importar(at, data, "backup2.zip", "backup 2", "recente 2")
+    # o desfazer só alcança o último import: só o arquivo que ele substituiu continua guardado
+    assert len(_substituidos(data)) == 1
+    assert _demandas_arquivadas(data) == ["backup 2"]
+    _clicar(at, "↩️ Desfazer última ação")
+    assert _demandas_arquivadas(data) == ["backup 1"]
+    assert _substituidos(data) == []
@@ -0,0 +1,54 @@
+# Round-trip dos CSVs pelos schemas de app.py (arquivos no formato antigo / gerados pelo baseline).
+import os
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+USERS_LEGADO = """usuario,nome,role,senha_hash,cor_tema,ativo,criado_em,ultimo_login,sala_atribuida
+diretor1,Diretor 1,Diretor,abc,,True,2025-10-06T01:29:54.733281,2025-10-06T02:13:15.242441,
+coord1,Coord 1,Coordenador,def,#ff0000,true,2025-10-06T01:29:54.733306,,3.0
+"""
+PROJ_LEGADO = """Sala,Equipe,Classe,Projetista,Pontuação,Status
+1,Hidrossanitário,S,Ana,3,Ativo
+1,Hidrossanitário,-,-,0,Ativo
+"""
+HIST_LEGADO = f"""Timestamp,Disciplina,Demanda,Projetista,Parâmetro,Nota,Resumo,PontosAtribuídos
+{pd.Timestamp.now()},Hidrossanitário,AVALIACAO_COORDENADOR:coord1,Ana,Proatividade,9,,
+"""
+
+def _rodar(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    assert not at.exception
+    return at
+
+def test_arquivo_legado_round_trip(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "users.csv").write_text(USERS_LEGADO, encoding="utf-8")
+    (data / "projetistas.csv").write_text(PROJ_LEGADO, encoding="utf-8")
+    (data / "historico_demandas.csv").write_text(HIST_LEGADO, encoding="utf-8")
+
+    at = _rodar(tmp_path, monkeypatch)
+    users = at.session_state["users"].set_index("usuario")
+    assert users.at["diretor1","cor_tema"] == ""
+    assert users.at["coord1","ultimo_login"] == ""
+    assert users.at["diretor1","criado_em"] == "2025-10-06T01:29:54.733281"
+    assert users.at["coord1","sala_atribuida"] == 3
+    assert pd.isna(users.at["diretor1","sala_atribuida"])
+    assert bool(users.at["coord1","ativo"])
+    hist = at.session_state["historico"]
+    assert hist.at[0,"Resumo"] == ""
+    assert pd.isna(hist.at[0,"PontosAtribuídos"])
+    assert "RankingClasse" in at.session_state["projetistas"].columns
+
+    # arquivo migrado: sem "nan"/"NaT" gravados e segunda leitura igual à primeira
+    texto = (data / "users.csv").read_text(encoding="utf-8")
+    assert "nan" not in texto and "NaT" not in texto
+    assert "2025-10-06T01:29:54.733281" in texto
+    at2 = _rodar(tmp_path, monkeypatch)
+    pd.testing.assert_frame_equal(at2.session_state["users"], at.session_state["users"])
+    pd.testing.assert_frame_equal(at2.session_state["historico"], at.session_state["historico"])